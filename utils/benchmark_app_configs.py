@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import functools
+import contextlib
+import tracemalloc
+import repo_data
+import generate_app_configs as gac
+
+
+'''
+Benchmarks the generate_app_configs.py stages offline, against the checked-in
+repo data and a synthetic electrum scan report, and optionally against coins
+files scaled up with renamed copies of every coin.
+
+    ./benchmark_app_configs.py                          # checked-in coins only
+    ./benchmark_app_configs.py --coins 5000 50000       # plus scaled coins files
+    ./benchmark_app_configs.py --save-baseline          # store the results as the baseline
+
+Each stage reports its best wall time over --rounds runs, with cold caches,
+and its peak traced memory from one extra run. Results are compared with
+benchmark_baseline.json when it exists.
+'''
+
+script_path = os.path.abspath(os.path.dirname(__file__))
+repo_path = script_path.replace("/utils", "")
+baseline_path = f"{script_path}/benchmark_baseline.json"
+
+DATA_FOLDERS = ["electrums", "ethereum", "tendermint", "explorers", "light_wallet_d"]
+SHARED_FOLDERS = ["api_ids", "slp"]
+# Timed separately inside parse_coins_repo, summed over all coins
+COIN_CONFIG_STAGES = ["get_protocol_info", "get_swap_contracts", "get_electrums", "get_explorers"]
+SCAN_PASS_RATE = 0.8
+
+
+def rename_coin(coin, copy):
+    """KMD -> KMDX1, BTC-segwit -> BTCX1-segwit, USDT-ERC20 -> USDTX1-ERC20"""
+    if copy == 0:
+        return coin
+    base, sep, rest = coin.partition("-")
+    return f"{base}X{copy}{sep}{rest}"
+
+
+def build_workspace(path, size=None, seed=0):
+    """
+    Lays out a repo tree at `path` for generate_app_configs: the coins file,
+    scaled to `size` entries with renamed copies, links to the per-coin data
+    files under the copied names, and a synthetic scan report in utils/.
+    """
+    with open(f"{repo_path}/coins", "r") as f:
+        coins_data = json.load(f)
+    size = size or len(coins_data)
+    # Platform coins are looked up by ticker in the protocol tables, only their tokens are copied
+    copyable = [
+        i for i in coins_data if i["coin"] not in gac.PROTOCOLS and i["coin"] not in gac.TESTNET_PROTOCOLS
+    ]
+    copies = max(0, size - len(coins_data) - 1) // len(copyable) + 1
+    coins = list(coins_data)
+    for copy in range(1, copies + 1):
+        for item in copyable:
+            coins.append(dict(item, coin=rename_coin(item["coin"], copy)))
+    with open(f"{path}/coins", "w") as f:
+        json.dump(coins[:size], f)
+
+    for folder in SHARED_FOLDERS:
+        os.symlink(f"{repo_path}/{folder}", f"{path}/{folder}")
+    for folder in DATA_FOLDERS:
+        os.mkdir(f"{path}/{folder}")
+        for f in os.listdir(f"{repo_path}/{folder}"):
+            for copy in range(copies + 1):
+                os.symlink(f"{repo_path}/{folder}/{f}", f"{path}/{folder}/{rename_coin(f, copy)}")
+
+    rng = random.Random(seed)
+    report = {}
+    for f in os.listdir(f"{repo_path}/electrums"):
+        with open(f"{repo_path}/electrums/{f}", "r") as fp:
+            electrums = json.load(fp)
+        coin_report = {"tcp": {}, "ssl": {}, "wss": {}}
+        for electrum in electrums:
+            servers = [(electrum.get("protocol", "TCP").lower(), electrum.get("url"))]
+            servers.append(("wss", electrum.get("ws_url")))
+            for protocol, server in servers:
+                if server is None or protocol not in coin_report:
+                    continue
+                passed = rng.random() < SCAN_PASS_RATE
+                coin_report[protocol][server] = {
+                    "last_connection": int(gac.current_time) if passed else 0,
+                    "result": "Passed" if passed else "Failed",
+                    "connect_ms": rng.randint(10, 400),
+                    "first_response_ms": rng.randint(10, 400),
+                    "height_lag": 0,
+                }
+        for copy in range(copies + 1):
+            report[rename_coin(f, copy)] = coin_report
+    os.mkdir(f"{path}/utils")
+    with open(f"{path}/utils/electrum_scan_report.json", "w") as f:
+        json.dump(report, f)
+    return size
+
+
+def reset_caches():
+    for i in vars(gac).values():
+        if isinstance(i, functools._lru_cache_wrapper):
+            i.cache_clear()
+    gac.valid_electrums_cache.clear()
+    repo_data.cache.clear()
+    repo_data.stats.update({"hits": 0, "misses": 0})
+
+
+def clear_outputs():
+    for f in os.listdir(gac.script_path):
+        if f.startswith("coins_config"):
+            os.remove(f"{gac.script_path}/{f}")
+
+
+@contextlib.contextmanager
+def timed_methods(totals):
+    """Adds the time spent in each COIN_CONFIG_STAGES method to `totals`."""
+    originals = {i: getattr(gac.CoinConfig, i) for i in COIN_CONFIG_STAGES}
+
+    def timed(name, method):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                totals[name] = totals.get(name, 0) + time.perf_counter() - start
+        return wrapper
+
+    for name, method in originals.items():
+        setattr(gac.CoinConfig, name, timed(f"parse_coins_repo/{name}", method))
+    try:
+        yield
+    finally:
+        for name, method in originals.items():
+            setattr(gac.CoinConfig, name, method)
+
+
+def run_pipeline(jobs=1, electrum_order="url", memory=False):
+    """Runs every stage once from cold caches. Returns {stage: seconds or peak bytes}."""
+    reset_caches()
+    clear_outputs()
+    results = {}
+
+    def stage(name, func, *args):
+        if memory:
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+        else:
+            start = time.perf_counter()
+        value = func(*args)
+        if memory:
+            results[name] = tracemalloc.get_traced_memory()[1] - start
+        else:
+            results[name] = time.perf_counter() - start
+        return value
+
+    totals = {}
+    with contextlib.redirect_stdout(io.StringIO()), timed_methods(totals):
+        coins_config, nodata = stage("parse_coins_repo", gac.parse_coins_repo, electrum_order, jobs)
+        variants = stage("get_config_variants", gac.get_config_variants, coins_config, nodata)
+        stage("write_config_variants", gac.write_config_variants, variants)
+    if not memory and jobs == 1:
+        results.update(totals)
+    return results
+
+
+def benchmark(size, rounds, jobs, electrum_order):
+    with tempfile.TemporaryDirectory() as path:
+        size = build_workspace(path, size)
+        gac.repo_path = path
+        gac.script_path = f"{path}/utils"
+        times = {}
+        for _ in range(rounds):
+            for k, v in run_pipeline(jobs, electrum_order).items():
+                times[k] = min(times.get(k, v), v)
+        tracemalloc.start()
+        peaks = run_pipeline(jobs, electrum_order, memory=True)
+        tracemalloc.stop()
+    return {
+        stage: {"coins": size, "seconds": round(seconds, 4), "peak_mb": round(peaks[stage] / 2**20, 2) if stage in peaks else None}
+        for stage, seconds in times.items()
+    }
+
+
+def print_results(results, baseline, threshold):
+    """Prints a table of results against the baseline. Returns the regressed stages."""
+    regressions = []
+    print(f"{'stage':<42}{'coins':>8}{'time ms':>11}{'baseline':>11}{'change':>9}{'peak MB':>10}")
+    for label, stages in results.items():
+        for stage, result in stages.items():
+            ms = result["seconds"] * 1000
+            previous = baseline.get(label, {}).get(stage)
+            change = ""
+            baseline_ms = ""
+            if previous:
+                baseline_ms = f"{previous['seconds'] * 1000:.1f}"
+                pct = (result["seconds"] / previous["seconds"] - 1) * 100 if previous["seconds"] else 0
+                change = f"{pct:+.1f}%"
+                if pct > threshold:
+                    regressions.append(f"{label} {stage}")
+                    change += " !"
+            peak = f"{result['peak_mb']:.2f}" if result["peak_mb"] is not None else ""
+            print(f"{label + ' ' + stage:<42}{result['coins']:>8}{ms:>11.1f}{baseline_ms:>11}{change:>9}{peak:>10}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the coins_config generation stages offline.")
+    parser.add_argument("--coins", nargs="*", type=int, default=[], help="Also benchmark synthetic coins files of these sizes")
+    parser.add_argument("--rounds", type=int, default=3, help="Runs per stage, the best time is reported")
+    parser.add_argument("--jobs", type=int, default=1, help="Passed to parse_coins_repo (per method timings need 1)")
+    parser.add_argument("--electrum-order", choices=["url", "latency"], default="url")
+    parser.add_argument("--threshold", type=float, default=20, help="Slowdown in percent reported as a regression")
+    parser.add_argument("--save-baseline", action="store_true", help=f"Store the results in {os.path.basename(baseline_path)}")
+    args = parser.parse_args()
+
+    results = {"repo": benchmark(None, args.rounds, args.jobs, args.electrum_order)}
+    for size in args.coins:
+        results[str(size)] = benchmark(size, args.rounds, args.jobs, args.electrum_order)
+
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path, "r") as f:
+            baseline = json.load(f)
+    regressions = print_results(results, baseline, args.threshold)
+
+    if args.save_baseline:
+        with open(baseline_path, "w") as f:
+            json.dump(dict(baseline, **results), f, indent=4)
+        print(f"\nBaseline saved to {baseline_path}")
+    elif regressions:
+        print(f"\nSlower than the baseline by more than {args.threshold}%: {', '.join(regressions)}")
+        sys.exit(1)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import scan_electrums
+from logger import logger
+
+
+'''
+Benchmarks scan_electrums.get_electrums_report() against a local
+mock_electrums.py fleet, and reports scan throughput and the latency
+distribution of the servers which passed.
+
+Options not listed below are passed on to mock_electrums.py:
+
+    ./benchmark_scan_electrums.py --endpoints 3000 --concurrency 200
+    ./benchmark_scan_electrums.py --endpoints 1000 --drop-rate 0.05 --silent-rate 0.01 --slow-handshake-rate 0.05
+    ./benchmark_scan_electrums.py --endpoints 300 --ports-per-host 100
+'''
+
+script_path = os.path.abspath(os.path.dirname(__file__))
+
+
+def start_fleet(fleet_args):
+    """Starts mock_electrums.py and returns the process and the electrums it serves."""
+    process = subprocess.Popen(
+        [sys.executable, f"{script_path}/mock_electrums.py", *fleet_args], stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        sys.exit(f"mock_electrums.py exited with code {process.returncode}")
+    return process, json.loads(line)
+
+
+def write_electrums(path, electrum_dict):
+    os.mkdir(f"{path}/electrums")
+    os.mkdir(f"{path}/utils")
+    for coin, electrums in electrum_dict.items():
+        with open(f"{path}/electrums/{coin}", "w") as f:
+            json.dump(electrums, f)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def get_scan_stats(report, elapsed):
+    results = {}
+    latencies = []
+    for coin in report.values():
+        for protocol in ["tcp", "ssl", "wss"]:
+            for entry in coin[protocol].values():
+                results[entry["result"]] = results.get(entry["result"], 0) + 1
+                if entry["result"] == "Passed":
+                    latencies.append(sum(entry.get(i) or 0 for i in ["connect_ms", "tls_ms", "first_response_ms"]))
+    probes = sum(results.values())
+    return {
+        "servers": probes,
+        "seconds": round(elapsed, 3),
+        "servers_per_second": round(probes / elapsed, 1),
+        "results": dict(sorted(results.items(), key=lambda x: -x[1])),
+        "latency_ms": {f"p{i}": percentile(latencies, i) for i in [50, 90, 99]} | {"max": max(latencies, default=None)},
+        "tls_sessions": dict(scan_electrums.get_ssl_context().stats),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the electrum scanner against a local mock fleet. Other options are passed to mock_electrums.py.")
+    parser.add_argument("--concurrency", type=int, default=scan_electrums.SCAN_CONCURRENCY, help="Max number of servers probed at once")
+    parser.add_argument("--per-host", type=int, default=scan_electrums.PER_HOST_CONCURRENCY, help="Max number of servers probed at once on the same hostname")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Keep the scanner's per server log lines")
+    args, fleet_args = parser.parse_known_args()
+
+    process, electrum_dict = start_fleet(fleet_args)
+    try:
+        with tempfile.TemporaryDirectory() as path:
+            write_electrums(path, electrum_dict)
+            scan_electrums.repo_path = path
+            scan_electrums.script_path = f"{path}/utils"
+            logger.disabled = not args.verbose
+            start = time.perf_counter()
+            scan_electrums.get_electrums_report(args.concurrency, per_host=args.per_host)
+            elapsed = time.perf_counter() - start
+            logger.disabled = False
+            with open(f"{path}/utils/electrum_scan_report.json", "r") as f:
+                report = json.load(f)
+    finally:
+        process.terminate()
+        process.wait()
+
+    stats = get_scan_stats(report, elapsed)
+    if args.json:
+        print(json.dumps(stats, indent=4))
+    else:
+        print(f"Scanned {stats['servers']} servers in {stats['seconds']}s: {stats['servers_per_second']} servers/s")
+        print(f"Results: {', '.join(f'{k}: {v}' for k, v in stats['results'].items())}")
+        print(f"Passed latency ms: {', '.join(f'{k} {v}' for k, v in stats['latency_ms'].items())}")
+        print(f"TLS sessions resumed: {stats['tls_sessions']['resumed']}/{stats['tls_sessions']['handshakes']}")
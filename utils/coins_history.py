@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+import json
+import argparse
+import subprocess
+from datetime import datetime, timezone
+from get_coins_diff import GitBlobReader, script_path
+
+'''
+Index of the utils/coins_config.json history: when each coin was listed and
+delisted, and which commits changed each of its fields.
+
+The first run walks every first parent commit that changed the config, later
+runs only read the commits added since. Queries read the index, not git.
+
+    ./coins_history.py KMD LTC              # update the index, then show KMD and LTC
+    ./coins_history.py --no-update KMD      # show KMD from the index as it is
+    ./coins_history.py -v --field electrum KMD
+
+To find the app release that matches a commit, compare its date with the
+release dates.
+'''
+
+CONFIG_PATH = "utils/coins_config.json"
+INDEX_VERSION = 1
+index_path = f"{script_path}/coins_history_index.json"
+
+
+def git(*args):
+    r = subprocess.run(["git", "-C", script_path, *args], capture_output=True, text=True, check=True)
+    return r.stdout
+
+
+def is_ancestor(commit):
+    r = subprocess.run(["git", "-C", script_path, "merge-base", "--is-ancestor", commit, "HEAD"], capture_output=True)
+    return r.returncode == 0
+
+
+def get_new_commits(head=None):
+    """Returns [sha, commit time] of the first parent commits after `head` that changed the config, oldest first."""
+    revisions = f"{head}..HEAD" if head else "HEAD"
+    log = git("log", "--reverse", "--first-parent", "--format=%H %ct", revisions, "--", f":/{CONFIG_PATH}")
+    return [[sha, int(timestamp)] for sha, timestamp in (i.split() for i in log.splitlines())]
+
+
+def new_index():
+    return {"version": INDEX_VERSION, "path": CONFIG_PATH, "head": None, "commits": [], "coins": {}}
+
+
+def load_index():
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return new_index()
+    if index.get("version") != INDEX_VERSION:
+        return new_index()
+    return index
+
+
+def record_changes(index, n, old_config, new_config):
+    """
+    Records the coins listed, delisted and the fields changed from old_config
+    to new_config under commit number `n`. Returns False if there were none.
+    """
+    coins = index["coins"]
+    changed = False
+    for coin in new_config:
+        if coin not in old_config:
+            coins.setdefault(coin, {"listed": [], "changes": {}})["listed"].append([n, None])
+            changed = True
+        elif old_config[coin] != new_config[coin]:
+            old_coin, new_coin = old_config[coin], new_config[coin]
+            if isinstance(old_coin, dict) and isinstance(new_coin, dict):
+                for field in {**old_coin, **new_coin}:
+                    if field not in old_coin or field not in new_coin or old_coin[field] != new_coin[field]:
+                        coins[coin]["changes"].setdefault(field, []).append(n)
+            changed = True
+    for coin in old_config:
+        if coin not in new_config:
+            coins[coin]["listed"][-1][1] = n
+            changed = True
+    return changed
+
+
+def update_index(index):
+    """Adds the commits made since the index was last updated. Returns the number of commits read."""
+    reader = GitBlobReader()
+    config = {}
+    data = None
+    if index["head"] is not None:
+        if is_ancestor(index["head"]):
+            data = reader.read(index["head"], CONFIG_PATH)
+            config = json.loads(data) if data is not None else {}
+        else:
+            # History was rewritten, start over
+            index.update(new_index())
+
+    commits = get_new_commits(index["head"])
+    # The last commit whose config parsed, the next run reads the config there.
+    head = index["head"]
+    for sha, timestamp in commits:
+        new_data = reader.read(sha, CONFIG_PATH)
+        if new_data == data:
+            head = sha
+            continue
+        try:
+            new_config = json.loads(new_data) if new_data is not None else {}
+        except json.JSONDecodeError:
+            print(f"Skipping {sha[:7]}, {CONFIG_PATH} is not valid JSON there")
+            continue
+        if record_changes(index, len(index["commits"]), config, new_config):
+            index["commits"].append([sha, timestamp])
+        config, data = new_config, new_data
+        head = sha
+    reader.close()
+
+    if commits:
+        index["head"] = head
+        with open(index_path, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+    return len(commits)
+
+
+def describe_commit(index, n):
+    sha, timestamp = index["commits"][n]
+    date = datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+    return f"{date} {sha[:7]}"
+
+
+def print_coin_history(index, coin, fields=None, verbose=False):
+    if coin not in index["coins"]:
+        print(f"{coin}: never listed in {CONFIG_PATH}")
+        return
+    history = index["coins"][coin]
+    print(coin)
+    for listed, delisted in history["listed"]:
+        until = f"delisted {describe_commit(index, delisted)}" if delisted is not None else "still listed"
+        print(f"  listed {describe_commit(index, listed)}, {until}")
+    for field, changes in sorted(history["changes"].items()):
+        if fields and field not in fields:
+            continue
+        print(f"  {field}: changed in {len(changes)} commits, last {describe_commit(index, changes[-1])}")
+        if verbose:
+            for n in changes:
+                print(f"    {describe_commit(index, n)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shows when coins were listed, delisted and changed in coins_config.json.")
+    parser.add_argument("coins", nargs="*", help="Tickers to show, e.g. KMD BTC-segwit")
+    parser.add_argument("--no-update", action="store_true", help="Query the index without reading new commits")
+    parser.add_argument("--field", action="append", help="Only show changes to this field (repeatable)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="List every commit that changed a field")
+    args = parser.parse_args()
+
+    index = load_index()
+    if not args.no_update:
+        read = update_index(index)
+        if read:
+            print(f"Indexed {read} new commits, {len(index['commits'])} with coin changes\n")
+    for coin in args.coins:
+        print_coin_history(index, coin, args.field, args.verbose)
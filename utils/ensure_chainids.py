@@ -1,6 +1,14 @@
 #!/usr/bin/env python3
-import requests
+import os
 import json
+import requests
+
+script_path = os.path.abspath(os.path.dirname(__file__))
+repo_path = script_path.replace("/utils", "")
+chains_url = "https://chainid.network/chains_mini.json"
+# Cached chain list, with the ETag and Last-Modified headers it was served with.
+# It is committed, so it is only rewritten when the list or its ETag changes.
+chains_cache_path = f"{script_path}/chains_mini_cache.json"
 
 supported_networks = {
     "BEP20": 56,
@@ -30,11 +38,87 @@ supported_platforms = {
 
 exclude_protocols = ['UTXO', 'QRC20', "SLPTOKEN", "ZHTLC", "BCH", "QTUM", "tQTUM"]
 
-def ensure_chainids():
-    url = "https://chainid.network/chains_mini.json"
-    networks = requests.get(url).json()
+def get_cached_chains():
+    """Returns the cached chain list and its headers, or None if there is no usable cache."""
+    if not os.path.exists(chains_cache_path):
+        return None
+    try:
+        with open(chains_cache_path, "r") as f:
+            cache = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring the unreadable chain list cache {chains_cache_path}: {e}")
+        return None
+    if not isinstance(cache, dict) or not isinstance(cache.get("chains"), list):
+        print(f"Ignoring the chain list cache {chains_cache_path}, it has no chain list")
+        return None
+    return cache
+
+
+def write_cached_chains(cache):
+    with open(chains_cache_path, "w") as f:
+        json.dump(cache, f)
+
+
+def get_chains(offline=False):
+    """
+    Returns the chainid.network chain list. The cached copy is revalidated
+    with If-None-Match / If-Modified-Since, unless `offline`. If the network
+    fails the cached copy is used, or an empty list if there is none.
+    """
+    cache = get_cached_chains()
+    if cache is not None:
+        if offline:
+            return cache["chains"]
+    elif offline:
+        print(f"No cached chain list at {chains_cache_path}, skipping chain id lookups")
+        return []
+
+    headers = {}
+    if cache is not None:
+        if cache.get("etag"):
+            headers.update({"If-None-Match": cache["etag"]})
+        if cache.get("last_modified"):
+            headers.update({"If-Modified-Since": cache["last_modified"]})
+    try:
+        r = requests.get(chains_url, headers=headers, timeout=10)
+        if r.status_code == 304 and cache is not None:
+            return cache["chains"]
+        r.raise_for_status()
+        chains = r.json()
+    except (requests.RequestException, ValueError) as e:
+        if cache is not None:
+            print(f"Failed to fetch {chains_url}, using the cached chain list: {e}")
+            return cache["chains"]
+        print(f"Failed to fetch {chains_url} and there is no cached chain list, skipping chain id lookups: {e}")
+        return []
+
+    etag = r.headers.get("ETag")
+    if cache is None or cache["chains"] != chains or cache.get("etag") != etag:
+        write_cached_chains({"etag": etag, "last_modified": r.headers.get("Last-Modified"), "chains": chains})
+    return chains
+
+
+def get_chain_indexes(chains):
+    """Returns the chains by native currency symbol and by chain id, keeping the first of each in list order."""
+    by_symbol = {}
+    by_chain_id = {}
+    for chain in chains:
+        if "nativeCurrency" in chain:
+            by_symbol.setdefault(chain["nativeCurrency"]["symbol"], chain)
+        by_chain_id.setdefault(chain.get("chainId"), chain)
+    return by_symbol, by_chain_id
+
+
+def describe_chain(chain_id, chains_by_id):
+    if chain_id in chains_by_id:
+        return f"{chain_id} ({chains_by_id[chain_id]['name']})"
+    return f"{chain_id}"
+
+
+def ensure_chainids(offline=False):
+    chains_by_symbol, chains_by_id = get_chain_indexes(get_chains(offline))
 
-    with open('../coins', 'r') as f:
+    with open(f"{repo_path}/coins", 'r') as f:
         coins = json.load(f)
 
     for i in coins:
@@ -55,7 +139,7 @@ def ensure_chainids():
                                     continue
                                 if platform in supported_platforms:
                                     network = supported_platforms[platform]
-                                    print(f"$$$ Chain ID set to {network} for {ticker}")
+                                    print(f"$$$ Chain ID set to {describe_chain(network, chains_by_id)} for {ticker}")
                                 else:
                                     print(f"!!! Unknown platform type for {ticker}: {i}")
                     elif i['protocol']['type'] in ['TENDERMINTTOKEN', 'TENDERMINT']:
@@ -72,12 +156,9 @@ def ensure_chainids():
                     continue
                 if suffix in supported_networks:
                     network = supported_networks[suffix]
-                    print(f"!!! Chain ID set to {network} for {ticker}")
-                else:
-                    for j in networks:
-                        if "nativeCurrency" in []:
-                            if j['nativeCurrency']['symbol'] == ticker:
-                                i['chain_id'] = j
-                                print(f">>> Chain ID set to {j} for {ticker}")
-                                break
+                    print(f"!!! Chain ID set to {describe_chain(network, chains_by_id)} for {ticker}")
+                elif ticker in chains_by_symbol:
+                    j = chains_by_symbol[ticker]
+                    i['chain_id'] = j['chainId']
+                    print(f">>> Chain ID set to {describe_chain(j['chainId'], chains_by_id)} for {ticker}")
 
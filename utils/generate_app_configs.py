@@ -1,18 +1,18 @@
 #!/usr/bin/env python3
 import os
-import sys
 import time
+import gzip
 import json
-from copy import deepcopy
-import requests
-from scan_electrums import get_electrums_report
-from ensure_chainids import ensure_chainids
+import hashlib
+import argparse
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from repo_data import FrozenDict, load_json, get_stats
 
 
 current_time = time.time()
 script_path = os.path.abspath(os.path.dirname(__file__))
 repo_path = script_path.replace("/utils", "")
-os.chdir(script_path)
 
 BINANCE_DELISTED_COINS = [
     "AGIX",
@@ -41,36 +41,69 @@ BINANCE_DELISTED_COINS = [
 ]
 
 # TODO: Check all coins have an icon.
-icons = [
-    f
-    for f in os.listdir(f"{repo_path}/icons")
-    if os.path.isfile(f"{repo_path}/icons/{f}.png")
-]
-lightwallet_coins = [
-    f
-    for f in os.listdir(f"{repo_path}/light_wallet_d")
-    if os.path.isfile(f"{repo_path}/light_wallet_d/{f}")
-]
-electrum_coins = [
-    f
-    for f in os.listdir(f"{repo_path}/electrums")
-    if os.path.isfile(f"{repo_path}/electrums/{f}")
-]
-tendermint_coins = [
-    f
-    for f in os.listdir(f"{repo_path}/tendermint")
-    if os.path.isfile(f"{repo_path}/tendermint/{f}")
-]
-ethereum_coins = [
-    f
-    for f in os.listdir(f"{repo_path}/ethereum")
-    if os.path.isfile(f"{repo_path}/ethereum/{f}")
-]
-explorer_coins = [
-    f
-    for f in os.listdir(f"{repo_path}/explorers")
-    if os.path.isfile(f"{repo_path}/explorers/{f}")
-]
+# Repo folders and data files are read on first use, so importing this module is cheap.
+@functools.cache
+def get_repo_files(folder):
+    """Names of the files in a repo folder, e.g. the coins which have an electrums/ file."""
+    return frozenset(
+        f
+        for f in os.listdir(f"{repo_path}/{folder}")
+        if os.path.isfile(f"{repo_path}/{folder}/{f}")
+    )
+
+
+@functools.cache
+def get_electrum_scan_report():
+    return load_json(f"{script_path}/electrum_scan_report.json")
+
+
+@functools.cache
+def get_explorer_paths():
+    return load_json(f"{repo_path}/explorers/explorer_paths.json")
+
+
+@functools.cache
+def get_explorer_path_info(explorer):
+    """Returns the explorer_paths.json entry of the first path found in an explorer url."""
+    for path, info in get_explorer_paths().items():
+        if path in explorer:
+            return info
+    return None
+
+
+@functools.cache
+def get_explorer_info(file_name):
+    """
+    Returns the explorer urls in explorers/{file_name}, and the config keys
+    they resolve to: the explorer_paths entries of every url, applied in
+    order, and the first url as explorer_url. Tokens share their parent's
+    file, so each file is resolved once.
+    """
+    explorers = load_json(f"{repo_path}/explorers/{file_name}")
+    info = {}
+    for x in explorers:
+        path_info = get_explorer_path_info(x)
+        if path_info is not None:
+            info.update(path_info)
+    if explorers:
+        info.update({"explorer_url": explorers[0]})
+    return explorers, info
+
+
+@functools.cache
+def get_api_ids(source):
+    return load_json(f"{repo_path}/api_ids/{source}_ids.json")
+
+
+@functools.cache
+def get_slp_bchd_urls():
+    return load_json(f"{repo_path}/slp/bchd_urls.json")
+
+
+# Latencies within the same bucket are considered equal when ranking electrums.
+ELECTRUM_LATENCY_BUCKET_MS = 50
+# Blocks an electrum can be behind the highest seen and still rank as in sync, as a block can arrive mid-scan.
+ELECTRUM_MAX_HEIGHT_LAG = 2
 
 binance_quote_tickers = [
     "BTC",
@@ -93,29 +126,59 @@ binance_quote_tickers = [
 
 
 
-with open(f"{script_path}/electrum_scan_report.json", "r") as f:
-    electrum_scan_report = json.load(f)
-
-with open(f"{repo_path}/explorers/explorer_paths.json", "r") as f:
-    explorer_paths = json.load(f)
-
-with open(f"{repo_path}/api_ids/forex_ids.json", "r") as f:
-    forex_ids = json.load(f)
-
-with open(f"{repo_path}/api_ids/livecoinwatch_ids.json", "r") as f:
-    livecoinwatch_ids = json.load(f)
-
-with open(f"{repo_path}/api_ids/binance_ids.json", "r") as f:
-    binance_ids = json.load(f)
-
-with open(f"{repo_path}/api_ids/coingecko_ids.json", "r") as f:
-    coingecko_ids = json.load(f)
-
-with open(f"{repo_path}/api_ids/coinpaprika_ids.json", "r") as f:
-    coinpaprika_ids = json.load(f)
-
-with open(f"{repo_path}/slp/bchd_urls.json", "r") as f:
-    bchd_urls = json.load(f)
+# Platform coin -> type of the tokens on it. A type may have several platforms,
+# get_parent_coin picks the first one listed.
+PROTOCOLS = FrozenDict({
+    "AVAX": "AVX-20",
+    "BNB": "BEP-20",
+    "ETC": "Ethereum Classic",
+    "ETH": "ERC-20",
+    "ETH-ARB20": "Arbitrum",
+    "EWT": "EWT",
+    "FTM": "FTM-20",
+    "GLMR": "Moonbeam",
+    "HT": "HecoChain",
+    "KCS": "KRC-20",
+    "MATIC": "Matic",
+    "MOVR": "Moonriver",
+    "ONE": "HRC-20",
+    "QTUM": "QRC-20",
+    "RBTC": "RSK Smart Bitcoin",
+    "SBCH": "SmartBCH",
+    "SLP": "SLPTOKEN",
+    "ATOM": "TENDERMINT",
+    "OSMO": "TENDERMINT",
+    "IRIS": "TENDERMINT",
+    "UBQ": "Ubiq",
+})
+
+TESTNET_PROTOCOLS = FrozenDict({
+    "AVAXT": "AVX-20",
+    "BNBT": "BEP-20",
+    "FTMT": "FTM-20",
+    "tSLP": "SLPTOKEN",
+    "tQTUM": "QRC-20",
+    "IRISTEST": "TENDERMINT",
+    "NUCLEUSTEST": "TENDERMINT",
+    "MATICTEST": "Matic",
+    "UBQ": "Ubiq",
+})
+
+
+def get_protocol_parents(protocols):
+    """Reverse of a protocols table: token type -> its first platform coin."""
+    parents = {}
+    for coin, token_type in protocols.items():
+        parents.setdefault(token_type, coin)
+    return FrozenDict(parents)
+
+
+PROTOCOL_PARENTS = get_protocol_parents(PROTOCOLS)
+TESTNET_PROTOCOL_PARENTS = get_protocol_parents(TESTNET_PROTOCOLS)
+
+
+# Valid electrums per (base coin, order), built once per run.
+valid_electrums_cache = {}
 
 
 def colorize(string, color):
@@ -133,46 +196,17 @@ def colorize(string, color):
 
 
 class CoinConfig:
+    __slots__ = ("coin_data", "data", "is_testnet", "ticker", "base_ticker", "coin_type", "parent_coin")
+
+    protocols = PROTOCOLS
+    testnet_protocols = TESTNET_PROTOCOLS
+
     def __init__(self, coin_data: dict):
         self.coin_data = coin_data
         self.data = {}
         self.is_testnet = self.is_testnet_network()
         self.ticker = self.coin_data["coin"].replace("-TEST", "")
         self.base_ticker = self.ticker.split("-")[0]
-        self.protocols = {
-            "AVAX": "AVX-20",
-            "BNB": "BEP-20",
-            "ETC": "Ethereum Classic",
-            "ETH": "ERC-20",
-            "ETH-ARB20": "Arbitrum",
-            "EWT": "EWT",
-            "FTM": "FTM-20",
-            "GLMR": "Moonbeam",
-            "HT": "HecoChain",
-            "KCS": "KRC-20",
-            "MATIC": "Matic",
-            "MOVR": "Moonriver",
-            "ONE": "HRC-20",
-            "QTUM": "QRC-20",
-            "RBTC": "RSK Smart Bitcoin",
-            "SBCH": "SmartBCH",
-            "SLP": "SLPTOKEN",
-            "ATOM": "TENDERMINT",
-            "OSMO": "TENDERMINT",
-            "IRIS": "TENDERMINT",
-            "UBQ": "Ubiq",
-        }
-        self.testnet_protocols = {
-            "AVAXT": "AVX-20",
-            "BNBT": "BEP-20",
-            "FTMT": "FTM-20",
-            "tSLP": "SLPTOKEN",
-            "tQTUM": "QRC-20",
-            "IRISTEST": "TENDERMINT",
-            "NUCLEUSTEST": "TENDERMINT",
-            "MATICTEST": "Matic",
-            "UBQ": "Ubiq",
-        }
         self.coin_type = coin_data["protocol"]["type"]
         self.data.update(
             {
@@ -209,9 +243,8 @@ class CoinConfig:
                     {"type": "UTXO", "bchd_urls": [], "other_types": ["SLP"]}
                 )
         elif self.coin_type in ["ZHTLC"]:
-            if self.ticker in lightwallet_coins:
-                with open(f"{repo_path}/light_wallet_d/{self.ticker}", "r") as f:
-                    lightwallet_servers = json.load(f)
+            if self.ticker in get_repo_files("light_wallet_d"):
+                lightwallet_servers = load_json(f"{repo_path}/light_wallet_d/{self.ticker}")
                 self.data[self.ticker].update(
                     {"light_wallet_d_servers": lightwallet_servers}
                 )
@@ -303,26 +336,31 @@ class CoinConfig:
 
     def get_forex_id(self):
         coin = self.ticker.replace("-segwit", "")
+        forex_ids = get_api_ids("forex")
         if coin in forex_ids:
             self.data[self.ticker].update({"forex_id": forex_ids[coin]})
 
     def get_coinpaprika_id(self):
         coin = self.ticker.replace("-segwit", "")
+        coinpaprika_ids = get_api_ids("coinpaprika")
         if coin in coinpaprika_ids:
             self.data[self.ticker].update({"coinpaprika_id": coinpaprika_ids[coin]})
 
     def get_coingecko_id(self):
         coin = self.ticker.replace("-segwit", "")
+        coingecko_ids = get_api_ids("coingecko")
         if coin in coingecko_ids:
             self.data[self.ticker].update({"coingecko_id": coingecko_ids[coin]})
 
     def get_livecoinwatch_id(self):
         coin = self.ticker.split("-")[0]
+        livecoinwatch_ids = get_api_ids("livecoinwatch")
         if coin in livecoinwatch_ids:
             self.data[self.ticker].update({"livecoinwatch_id": livecoinwatch_ids[coin]})
 
     def get_binance_id(self):
         coin = self.ticker.split("-")[0]
+        binance_ids = get_api_ids("binance")
         if coin in binance_ids:
             self.data[self.ticker].update({"binance_id": binance_ids[coin]})
 
@@ -397,19 +435,18 @@ class CoinConfig:
 
         if self.coin_type not in ["UTXO", "ZHTLC", "BCH", "QTUM"]:
             if self.data[self.ticker]["is_testnet"]:
-                key_list = list(self.testnet_protocols.keys())
-                value_list = list(self.testnet_protocols.values())
+                protocols = self.testnet_protocols
+                parents = TESTNET_PROTOCOL_PARENTS
             else:
-                key_list = list(self.protocols.keys())
-                value_list = list(self.protocols.values())
-            if self.ticker in key_list:
+                protocols = self.protocols
+                parents = PROTOCOL_PARENTS
+            if self.ticker in protocols:
                 return self.ticker
 
             if self.ticker == "RBTC":
                 token_type = "RSK Smart Bitcoin"
-            if token_type in value_list:
-                i = value_list.index(token_type)
-                return key_list[i]
+            if token_type in parents:
+                return parents[token_type]
             print(f"{token_type} not in value_list")
         return None
 
@@ -421,7 +458,7 @@ class CoinConfig:
             if i not in self.data[self.ticker]:
                 self.data[self.ticker].update({i: self.coin_data[i]})
 
-    def get_electrums(self):
+    def get_electrums(self, electrum_order="url"):
         coin = self.ticker.replace("-segwit", "")
         if self.data[self.ticker]["type"] == "QRC-20":
             if self.is_testnet:
@@ -429,58 +466,41 @@ class CoinConfig:
             else:
                 coin = "QTUM"
 
-        if coin in electrum_coins:
-            with open(f"{repo_path}/electrums/{coin}", "r") as f:
-                electrums = json.load(f)
-                
+        electrums = []
+        if coin in get_repo_files("electrums"):
+            electrums = load_json(f"{repo_path}/electrums/{coin}")
+
+        electrum_scan_report = get_electrum_scan_report()
         if coin in electrum_scan_report:
-            valid_electrums = []
-            for x in ["tcp", "ssl", "wss"]:
-                # This also filers ws with tcp/ssl server it is grouped with if valid.
-                for k, v in electrum_scan_report[coin][x].items():
-                    if (
-                        current_time - v["last_connection"] < 604800
-                    ):  # 1 week grace period
-                        for electrum in electrums:
-                            electrum["protocol"] = x.upper()
-                            e = deepcopy(electrum)
-                            if "url" in e:
-                                if e["url"] == k:
-                                    if "ws_url" in e:
-                                        del e["ws_url"]
-                                    valid_electrums.append(e)
-                            e = deepcopy(electrum)
-                            if "ws_url" in e:
-                                e["protocol"] = "WSS"
-                                if e["ws_url"] == k:
-                                    e["url"] = k
-                                    del e["ws_url"]
-                                    valid_electrums.append(e)
-            if len(valid_electrums) > 0:
-                valid_electrums = sort_dicts_list(valid_electrums, "url")                 
+            # Tokens and -segwit variants share the base coin's list.
+            if (coin, electrum_order) not in valid_electrums_cache:
+                valid_electrums_cache.update({
+                    (coin, electrum_order): get_valid_electrums(
+                        electrums, electrum_scan_report[coin], electrum_order
+                    )
+                })
+            valid_electrums = list(valid_electrums_cache[(coin, electrum_order)])
             self.data[self.ticker].update({"electrum": valid_electrums})
         elif self.coin_type in ["SIA"]:
             self.data[self.ticker].update({"nodes": electrums})
 
     def get_bchd_urls(self):
+        bchd_urls = get_slp_bchd_urls()
         if self.ticker in bchd_urls:
             self.data[self.ticker].update({"bchd_urls": bchd_urls[self.ticker]})
 
     def get_swap_contracts(self):
         contract_data = None
 
-        if self.ticker in ethereum_coins:
-            with open(f"{repo_path}/ethereum/{self.ticker}", "r") as f:
-                contract_data = json.load(f)
+        if self.ticker in get_repo_files("ethereum"):
+            contract_data = load_json(f"{repo_path}/ethereum/{self.ticker}")
 
         elif self.data[self.ticker]["type"] in ["TENDERMINT", "TENDERMINTTOKEN"]:
-            with open(f"{repo_path}/tendermint/{self.parent_coin}", "r") as f:
-                contract_data = json.load(f)
+            contract_data = load_json(f"{repo_path}/tendermint/{self.parent_coin}")
 
-        elif self.ticker not in electrum_coins:
+        elif self.ticker not in get_repo_files("electrums"):
             if self.parent_coin not in ["SLP", "tSLP", None]:
-                with open(f"{repo_path}/ethereum/{self.parent_coin}", "r") as f:
-                    contract_data = json.load(f)
+                contract_data = load_json(f"{repo_path}/ethereum/{self.parent_coin}")
 
         if contract_data:
             if "swap_contract_address" in contract_data:
@@ -503,22 +523,14 @@ class CoinConfig:
     def get_explorers(self):
         explorers = None
         coin = self.ticker.replace("-segwit", "")
-        if coin in explorer_coins:
-            with open(f"{repo_path}/explorers/{coin}", "r") as f:
-                explorers = json.load(f)
+        if coin in get_repo_files("explorers"):
+            explorers, explorer_info = get_explorer_info(coin)
 
-        elif self.parent_coin in explorer_coins:
-            with open(f"{repo_path}/explorers/{self.parent_coin}", "r") as f:
-                explorers = json.load(f)
+        elif self.parent_coin in get_repo_files("explorers"):
+            explorers, explorer_info = get_explorer_info(self.parent_coin)
 
         if explorers:
-            for x in explorers:
-                for p in explorer_paths:
-                    if x.find(p) > -1:
-                        self.data[self.ticker].update(explorer_paths[p])
-                        break
-
-            self.data[self.ticker].update({"explorer_url": explorers[0]})
+            self.data[self.ticker].update(explorer_info)
             for i in [
                 ("explorer_tx_url", "tx/"),
                 ("explorer_address_url", "address/"),
@@ -528,36 +540,119 @@ class CoinConfig:
                     self.data[self.ticker].update({i[0]: i[1]})
 
 
-def parse_coins_repo():
+def get_valid_electrums(electrums, coin_scan_report, electrum_order="url"):
+    """
+    Returns the electrums which connected within the last week, one entry
+    per scan report server, with "protocol" set from the report. A ws_url
+    which passed becomes its own WSS entry.
+    """
+    # Maps each url / ws_url to the electrums listing it, in file order.
+    index = {}
+    for i, electrum in enumerate(electrums):
+        if "url" in electrum:
+            index.setdefault(electrum["url"], []).append((i, "url"))
+        if "ws_url" in electrum:
+            index.setdefault(electrum["ws_url"], []).append((i, "ws_url"))
+
+    valid_electrums = []
+    ranks = []
+    for x in ["tcp", "ssl", "wss"]:
+        # This also filers ws with tcp/ssl server it is grouped with if valid.
+        for k, v in coin_scan_report[x].items():
+            if current_time - v["last_connection"] >= 604800:  # 1 week grace period
+                continue
+            for i, key in sorted(index.get(k, [])):
+                e = dict(electrums[i])
+                e["protocol"] = x.upper()
+                if key == "ws_url":
+                    e["protocol"] = "WSS"
+                    e["url"] = k
+                e.pop("ws_url", None)
+                valid_electrums.append(e)
+                ranks.append(electrum_rank(v))
+
+    if electrum_order == "latency":
+        ranked = sorted(zip(ranks, valid_electrums), key=lambda x: (x[0], x[1]["url"], x[1]["protocol"]))
+        return [e for rank, e in ranked]
+    return sort_dicts_list(valid_electrums, "url")
+
+
+def electrum_rank(scan_result):
+    """
+    Sort key for an electrum scan report entry: servers which passed the last
+    scan and are in sync come first, then faster ones. Latency is bucketed
+    so small jitter between scans does not reorder the generated configs.
+    """
+    passed = scan_result["result"] == "Passed"
+    in_sync = scan_result.get("height_lag", 0) <= ELECTRUM_MAX_HEIGHT_LAG
+    timings = [scan_result.get(i) for i in ["connect_ms", "tls_ms", "first_response_ms"]]
+    if passed and timings[0] is not None and timings[2] is not None:
+        latency = sum([i for i in timings if i is not None]) // ELECTRUM_LATENCY_BUCKET_MS
+    else:
+        latency = float("inf")
+    return (not passed, not in_sync, latency)
+
+
+def build_coin_config(item, electrum_order="url"):
+    config = CoinConfig(item)
+    config.get_generics()
+    config.get_protocol_info()
+    config.clean_name()
+    config.get_swap_contracts()
+    config.get_electrums(electrum_order)
+    config.get_explorers()
+    config.is_smartchain()
+    config.is_wallet_only()
+    config.get_address_format()
+    config.get_rewards_info()
+    config.get_alias_ticker()
+    config.get_asset()
+    config.get_forex_id()
+    config.get_coinpaprika_id()
+    config.get_coingecko_id()
+    config.get_livecoinwatch_id()
+    config.get_binance_id()
+    config.get_bchd_urls()
+    config.get_hd_info()
+    config.get_links()
+    return config.data
+
+
+def preload_repo_data():
+    """Parses every per-coin source file up front, so pool workers start with a warm cache."""
+    for folder in ["electrums", "ethereum", "tendermint", "explorers", "light_wallet_d"]:
+        for f in os.listdir(f"{repo_path}/{folder}"):
+            if os.path.isfile(f"{repo_path}/{folder}/{f}"):
+                try:
+                    load_json(f"{repo_path}/{folder}/{f}")
+                except json.decoder.JSONDecodeError:
+                    pass
+
+
+def parse_coins_repo(electrum_order="url", jobs=1):
+    """
+    Builds the config of every mm2 enabled coin. With jobs > 1 coins are
+    built in a process pool (jobs=0 uses all cores); results are merged in
+    the order of the coins file, so the output is the same either way.
+    """
     errors = []
     coins_config = {}
     with open(f"{repo_path}/coins", "r") as f:
         coins_data = json.load(f)
+    items = [item for item in coins_data if item["mm2"] == 1]
 
-    for item in coins_data:
-        if item["mm2"] == 1:
-            config = CoinConfig(item)
-            config.get_generics()
-            config.get_protocol_info()
-            config.clean_name()
-            config.get_swap_contracts()
-            config.get_electrums()
-            config.get_explorers()
-            config.is_smartchain()
-            config.is_wallet_only()
-            config.get_address_format()
-            config.get_rewards_info()
-            config.get_alias_ticker()
-            config.get_asset()
-            config.get_forex_id()
-            config.get_coinpaprika_id()
-            config.get_coingecko_id()
-            config.get_livecoinwatch_id()
-            config.get_binance_id()
-            config.get_bchd_urls()
-            config.get_hd_info()
-            config.get_links()
-            coins_config.update(config.data)
+    pooled = jobs != 1
+    if not pooled:
+        results = [build_coin_config(item, electrum_order) for item in items]
+    else:
+        jobs = jobs or os.cpu_count()
+        chunksize = len(items) // (jobs * 4) + 1
+        with ProcessPoolExecutor(max_workers=jobs, initializer=preload_repo_data) as executor:
+            results = list(executor.map(
+                build_coin_config, items, [electrum_order] * len(items), chunksize=chunksize
+            ))
+    for data in results:
+        coins_config.update(data)
 
     nodata = []
     for coin in coins_config:
@@ -575,6 +670,12 @@ def parse_coins_repo():
             ):
                 nodata.append(coin)
 
+    # Pool workers keep their own caches, the parent's counters would not cover them.
+    if not pooled:
+        cache_stats = get_stats()
+        print(
+            f"Repo data cache: {cache_stats['files']} files, {cache_stats['hits']} hits, {cache_stats['misses']} misses"
+        )
     print(
         f"The following coins are missing required data or failing connections for nodes/electrums {nodata}"
     )
@@ -598,129 +699,291 @@ def get_desktop_repo_coins_data():
         return json.load(f)
 
 
-def filter_ssl(coins_config):
-    coins_config_ssl = {}
-    for coin in coins_config:
-        coins_config_ssl.update({coin: coins_config[coin]})
-        if "electrum" in coins_config[coin]:
-            electrums = []
-            for i in coins_config[coin]["electrum"]:
-                if "protocol" in i:
-                    if i["protocol"] == "SSL":
-                        electrums.append(i)
-            if len(coins_config_ssl[coin]["electrum"]) == 0:
-                del coins_config_ssl[coin]
-            else:
-                electrums = filter_duplicate_domains(electrums)
-                coins_config_ssl[coin]["electrum"] = electrums
+def get_ssl_variant(coin_config):
+    """Returns the SSL only variant of a coin config, or None to omit the coin."""
+    variant = dict(coin_config)
+    if "electrum" in coin_config:
+        if len(coin_config["electrum"]) == 0:
+            return None
+        electrums = [i for i in coin_config["electrum"] if i.get("protocol") == "SSL"]
+        variant["electrum"] = filter_duplicate_domains(electrums)
 
-        if "nodes" in coins_config[coin]:
-            coins_config_ssl[coin]["nodes"] = [
-                i for i in coins_config[coin]["nodes"] if i["url"].startswith("https")
-            ]
+    if "nodes" in coin_config:
+        variant["nodes"] = [
+            i for i in coin_config["nodes"] if i["url"].startswith("https")
+        ]
 
-        if "light_wallet_d_servers" in coins_config[coin]:
-            coins_config_ssl[coin]["light_wallet_d_servers"] = [
-                i
-                for i in coins_config[coin]["light_wallet_d_servers"]
-                if i.startswith("https")
-            ]
+    if "light_wallet_d_servers" in coin_config:
+        variant["light_wallet_d_servers"] = [
+            i for i in coin_config["light_wallet_d_servers"] if i.startswith("https")
+        ]
+    return variant
 
-    with open(f"{script_path}/coins_config_ssl.json", "w+") as f:
-        json.dump(coins_config_ssl, f, indent=4)
-    return coins_config_ssl
 
-
-def item_exists(i, electrums):
-    for e in electrums:
-        if "url" in e and "url" in i:
-            if i["url"] == e["url"]:
-                return True
-        if "ws_url" in e and "ws_url" in i:
-            if i["ws_url"] == e["ws_url"]:
-                return True
-    return False
+def electrum_keys(electrum):
+    """Returns the (key, address) pairs that identify an electrum server entry."""
+    return {(k, electrum[k]) for k in ("url", "ws_url") if k in electrum}
 
 
 def filter_duplicate_domains(electrums):
-    domains = {}
+    """Drops TCP servers on hosts that also serve SSL."""
+    protocols = {}
     for i in electrums:
-        domain = i["url"].split(":")[0]
-        if domain not in domains:
-            domains.update({domain: {i['protocol']: i['url']}})
+        protocols.setdefault(i["url"].split(":")[0], set()).add(i["protocol"])
+    return [
+        i
+        for i in electrums
+        if i["protocol"] != "TCP" or "SSL" not in protocols[i["url"].split(":")[0]]
+    ]
+
+
+def get_tcp_variant(coin_config, ssl_variant):
+    """Returns the legacy desktop variant of a coin config, or None to omit the coin."""
+    variant = dict(coin_config)
+    # Omit gui_auth: true nodes - these are web only.
+    if "nodes" in coin_config:
+        variant["nodes"] = [i for i in coin_config["nodes"] if "gui_auth" not in i]
+    if "electrum" in coin_config:
+        if len(coin_config["electrum"]) == 0:
+            return None
+        electrums = []
+        # Prefer SSL
+        if ssl_variant is not None and len(ssl_variant["electrum"]) > 0:
+            electrums = list(ssl_variant["electrum"])
+        seen = set()
+        for i in electrums:
+            seen.update(electrum_keys(i))
+        for i in coin_config["electrum"]:
+            if "gui_auth" in i:
+                if i["gui_auth"] == True:
+                    continue
+            keys = electrum_keys(i)
+            if seen.isdisjoint(keys):
+                # SSL is ok for legacy desktop so we allow them, else some coins with only SSL will be omited.
+                if i.get("protocol") != "WSS":
+                    electrums.append(i)
+                    seen.update(keys)
+        variant["electrum"] = filter_duplicate_domains(electrums)
+    return variant
+
+
+def get_wss_variant(coin_config):
+    """Returns the WSS only variant of a coin config, or None to omit the coin."""
+    if "electrum" not in coin_config:
+        return None
+    electrums = []
+    for i in coin_config["electrum"]:
+        if "protocol" in i:
+            if i["protocol"] == "WSS":
+                electrums.append(i)
         else:
-            domains[domain].update({i['protocol']: i['url']})
-    for i in domains:
-        if "SSL" in domains[i] and "TCP" in domains[i]:
-            for e in electrums:
-                if e["url"].startswith(i) and e["protocol"] == "TCP":
-                    electrums.remove(e)
-    return electrums
-    
-
-    
-
-def filter_tcp(coins_config, coins_config_ssl):
-    coins_config_tcp = {}
-    for coin in coins_config:
-        coins_config_tcp.update({coin: coins_config[coin]})
-        # Omit gui_auth: true nodes - these are web only.
-        if "nodes" in coins_config[coin]:
-            coins_config_tcp[coin]["nodes"] = [
-                i for i in coins_config[coin]["nodes"] if "gui_auth" not in i
-            ]
-        if "electrum" in coins_config[coin]:
-            electrums = []
-            # Prefer SSL
-            if coin in coins_config_ssl:
-                if len(coins_config_ssl[coin]["electrum"]) > 0:
-                    electrums = coins_config_ssl[coin]["electrum"]
-            for i in coins_config[coin]["electrum"]:
-                if "gui_auth" in i:
-                    if i["gui_auth"] == True:
-                        continue
-                if item_exists(i, electrums) == False:
-                    if "protocol" in i:
-                        # SSL is ok for legacy desktop so we allow them, else some coins with only SSL will be omited.
-                        if i["protocol"] != "WSS":
-                            electrums.append(i)
-                    else:
-                        electrums.append(i)
-
-            if len(coins_config_tcp[coin]["electrum"]) == 0:
-                del coins_config_tcp[coin]
-            else:
-                electrums = filter_duplicate_domains(electrums)
-                coins_config_tcp[coin]["electrum"] = electrums
-
-    with open(f"{script_path}/coins_config_tcp.json", "w+") as f:
-        json.dump(coins_config_tcp, f, indent=4)
-    return coins_config_tcp
-
-
-def filter_wss(coins_config):
-    coins_config_wss = {}
-    for coin in coins_config:
-        if "electrum" in coins_config[coin]:
-            electrums = []
-            for i in coins_config[coin]["electrum"]:
-                if "protocol" in i:
-                    if i["protocol"] == "WSS":
-                        electrums.append(i)
-                else:
-                    print(i)
-            if len(electrums) > 0:
-                coins_config_wss.update({coin: coins_config[coin]})
-                coins_config_wss[coin]["electrum"] = electrums
+            print(i)
+    if len(electrums) == 0:
+        return None
+    return dict(coin_config, electrum=electrums)
+
+
+def get_config_variants(coins_config, nodata):
+    """
+    Builds every coins_config*.json variant in a single pass over the coins,
+    keyed by file name. Variants only copy the top level of each coin config
+    and the lists they filter, everything else is shared with coins_config,
+    so treat the result as read-only.
+    """
+    variants = {
+        "coins_config_unfiltered": coins_config,  # Includes failing servers
+        "coins_config": {},
+        "coins_config_ssl": {},
+        "coins_config_tcp": {},
+        "coins_config_wss": {},
+    }
+    nodata = set(nodata)
+    for coin, coin_config in coins_config.items():
+        if coin in nodata:
+            continue
+        variants["coins_config"][coin] = coin_config
+        ssl_variant = get_ssl_variant(coin_config)
+        if ssl_variant is not None:
+            variants["coins_config_ssl"][coin] = ssl_variant
+        tcp_variant = get_tcp_variant(coin_config, ssl_variant)
+        if tcp_variant is not None:
+            variants["coins_config_tcp"][coin] = tcp_variant
+        wss_variant = get_wss_variant(coin_config)
+        if wss_variant is not None:
+            variants["coins_config_wss"][coin] = wss_variant
+    return variants
+
+
+class BrotliWriter:
+    """Binary file wrapper that brotli compresses everything written to it."""
+
+    def __init__(self, path):
+        import brotli
+
+        self.file = open(path, "wb")
+        self.compressor = brotli.Compressor(quality=11)
+
+    def write(self, data):
+        self.file.write(self.compressor.process(data))
+
+    def close(self):
+        self.file.write(self.compressor.finish())
+        self.file.close()
+
+
+def iter_compact_json(data):
+    """Yields the compact JSON encoding of a coins config one coin at a time."""
+    yield "{"
+    for n, (coin, coin_config) in enumerate(data.items()):
+        separator = "," if n else ""
+        yield f'{separator}{json.dumps(coin)}:{json.dumps(coin_config, separators=(",", ":"))}'
+    yield "}"
+
+
+def write_config_files(name, data, compact=False, compress=()):
+    """
+    Writes a coins config variant to {name}.json, plus optional compact
+    copies: {name}.min.json, .min.json.gz and .min.json.br. The compact
+    encoding is streamed coin by coin to every compact file at once.
+    """
+    with open(f"{script_path}/{name}.json", "w+") as f:
+        json.dump(data, f, indent=4)
+
+    path = f"{script_path}/{name}.min.json"
+    sinks = []
+    if compact:
+        sinks.append(open(path, "wb"))
+    if "gzip" in compress:
+        # mtime=0 keeps the output identical across runs for unchanged data
+        sinks.append(gzip.GzipFile(f"{path}.gz", "wb", compresslevel=9, mtime=0))
+    if "brotli" in compress:
+        sinks.append(BrotliWriter(f"{path}.br"))
+    if not sinks:
+        return
+    try:
+        for chunk in iter_compact_json(data):
+            chunk = chunk.encode()
+            for sink in sinks:
+                sink.write(chunk)
+    finally:
+        for sink in sinks:
+            sink.close()
+
+
+def get_config_file_names(name, compact=False, compress=()):
+    """Returns the names of the files write_config_files writes for a variant."""
+    file_names = [f"{name}.json"]
+    if compact:
+        file_names.append(f"{name}.min.json")
+    for method, extension in (("gzip", ".gz"), ("brotli", ".br")):
+        if method in compress:
+            file_names.append(f"{name}.min.json{extension}")
+    return file_names
+
+
+def get_content_hashes(data, memo):
+    """
+    Returns the canonical sha256 of a coins config variant and of each coin
+    in it. Key order is ignored, so reordering alone is not a change.
+    `memo` is keyed by object id, variants share most coin configs.
+    """
+    coins = {}
+    for coin, coin_config in data.items():
+        if id(coin_config) not in memo:
+            canonical = json.dumps(coin_config, sort_keys=True, separators=(",", ":"))
+            memo[id(coin_config)] = hashlib.sha256(canonical.encode()).hexdigest()
+        coins[coin] = memo[id(coin_config)]
+    content = "".join(f"{coin}:{coins[coin]}\n" for coin in sorted(coins))
+    return hashlib.sha256(content.encode()).hexdigest(), coins
+
+
+def get_file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def get_previous_output(file_name):
+    if os.path.exists(f"{script_path}/{file_name}"):
+        with open(f"{script_path}/{file_name}", "r") as f:
+            return json.load(f)
+    return {}
+
+
+def get_config_delta(name, data, content_hash):
+    """
+    Returns the delta from the {name}.json on disk to `data`, tagged with the
+    content hashes of both, or None if there is no previous file or its
+    content is the same.
+    """
+    from get_coins_diff import get_coins_delta
+
+    previous = get_previous_output(f"{name}.json")
+    if not previous:
+        return None
+    previous_hash, _ = get_content_hashes(previous, {})
+    if previous_hash == content_hash:
+        return None
+    return {"from": previous_hash, "to": content_hash, **get_coins_delta(previous, data)}
+
+
+def write_config_variants(variants, compact=False, compress=()):
+    """
+    Writes every coins config variant whose content changed since the last
+    run, then updates coins_config_manifest.json with the content hash,
+    file hashes and per coin hashes of each variant. The changes to each
+    rewritten variant are recorded in coins_config_delta.json, so clients
+    holding the "from" hash can patch their copy up to the "to" hash.
+    Returns the names of the variants that were left untouched.
+    """
+    manifest = get_previous_output("coins_config_manifest.json")
+    deltas = get_previous_output("coins_config_delta.json")
+    updated_manifest = {}
+    updated_deltas = dict(deltas)
+    unchanged = []
+    memo = {}
+    for name, data in variants.items():
+        content_hash, coin_hashes = get_content_hashes(data, memo)
+        file_names = get_config_file_names(name, compact, compress)
+        previous = manifest.get(name, {})
+        previous_files = previous.get("files", {})
+        if previous.get("content_hash") == content_hash and all(
+            i in previous_files
+            and os.path.exists(f"{script_path}/{i}")
+            and get_file_hash(f"{script_path}/{i}") == previous_files[i]
+            for i in file_names
+        ):
+            unchanged.append(name)
+            files = {i: previous_files[i] for i in file_names}
+        else:
+            delta = get_config_delta(name, data, content_hash)
+            if delta is not None:
+                updated_deltas.update({name: delta})
+            write_config_files(name, data, compact, compress)
+            files = {i: get_file_hash(f"{script_path}/{i}") for i in file_names}
+        updated_manifest.update(
+            {
+                name: {
+                    "content_hash": content_hash,
+                    "files": files,
+                    "coins": {coin: h[:16] for coin, h in coin_hashes.items()},
+                }
+            }
+        )
 
-    with open(f"{script_path}/coins_config_wss.json", "w+") as f:
-        json.dump(coins_config_wss, f, indent=4)
-    return coins_config_wss
+    if updated_manifest != manifest:
+        with open(f"{script_path}/coins_config_manifest.json", "w+") as f:
+            json.dump(updated_manifest, f, indent=4)
+    if updated_deltas != deltas:
+        with open(f"{script_path}/coins_config_delta.json", "w+") as f:
+            json.dump(updated_deltas, f, indent=4)
+    return unchanged
 
 
 def generate_binance_api_ids(coins_config):
+    import requests
+
     mm2_coins = coins_config.keys()
-    r = requests.get("https://defi-stats.komodo.earth/api/v3/binance/ticker_price")
+    r = requests.get("https://defi-stats.komodo.earth/api/v3/binance/ticker_price", timeout=10)
     binance_tickers = r.json()
     pairs = []
     for ticker in binance_tickers:
@@ -765,28 +1028,36 @@ def sort_dicts_list(data, sort_key):
 
 
 if __name__ == "__main__":
-    skip_scan = False
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "no-scan":
-            skip_scan = True
-    if skip_scan is False:
-        get_electrums_report()
-    ensure_chainids()
-    coins_config, nodata = parse_coins_repo()
-    # Includes failing servers
-    with open(f"{script_path}/coins_config_unfiltered.json", "w+") as f:
-        json.dump(coins_config, f, indent=4)
+    parser = argparse.ArgumentParser(description="Generates the coins_config*.json files for the apps.")
+    parser.add_argument("scan", nargs="?", choices=["no-scan", "incremental-scan"], help="Skip the electrum scan, or only probe failed, new or stale servers")
+    parser.add_argument("--electrum-order", choices=["url", "latency"], default="url", help="Order of electrums in the configs: alphabetical, or best measured servers first")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of processes building coin configs (0 for one per core)")
+    parser.add_argument("--offline", action="store_true", help="Use the cached chainid.network chain list without revalidating it")
+    parser.add_argument("--compact", action="store_true", help="Also write unindented {name}.min.json copies of the configs")
+    parser.add_argument("--compress", action="append", choices=["gzip", "brotli"], default=[], help="Also write compressed {name}.min.json.gz / .br copies of the configs (repeatable)")
+    args = parser.parse_args()
+    if "brotli" in args.compress:
+        try:
+            import brotli
+        except ImportError:
+            parser.error("--compress brotli needs the brotli package: pip3 install brotli")
+    from scan_electrums import get_electrums_report
+    from ensure_chainids import ensure_chainids
+
+    os.chdir(script_path)
+    if args.scan != "no-scan":
+        get_electrums_report(incremental=args.scan == "incremental-scan")
+    ensure_chainids(args.offline)
+    coins_config, nodata = parse_coins_repo(args.electrum_order, args.jobs)
     generate_binance_api_ids(coins_config)
 
-    # Remove failing servers
-    for coin in nodata:
-        del coins_config[coin]
-    with open(f"{script_path}/coins_config.json", "w+") as f:
-        json.dump(coins_config, f, indent=4)
-        
-    coins_config_ssl = filter_ssl(deepcopy(coins_config))
-    coins_config_wss = filter_wss(deepcopy(coins_config))
-    coins_config_tcp = filter_tcp(deepcopy(coins_config), coins_config_ssl)
+    variants = get_config_variants(coins_config, nodata)
+    unchanged = write_config_variants(variants, args.compact, args.compress)
+
+    coins_config = variants["coins_config"]
+    coins_config_ssl = variants["coins_config_ssl"]
+    coins_config_tcp = variants["coins_config_tcp"]
+    coins_config_wss = variants["coins_config_wss"]
     for coin in coins_config:
         if (
             coin in coins_config_tcp
@@ -809,3 +1080,5 @@ if __name__ == "__main__":
     print(f"Total coins with SSL: {len(coins_config_ssl)}")
     print(f"Total coins with TCP: {len(coins_config_tcp)}")
     print(f"Total coins with WSS: {len(coins_config_wss)}")
+    if unchanged:
+        print(f"Unchanged, not rewritten: {', '.join(f'{i}.json' for i in unchanged)}")
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
+import os
+import sys
+import json
 import argparse
-import requests
-import dotenv
+import subprocess
 
 '''
 Use this script to determine which coins were added or removed between two commits.
@@ -9,14 +11,83 @@ To find the commit that matches app release dates, refer to
 https://github.com/KomodoPlatform/coins/commits/master/utils/coins_config.json
 
 You can use the full hash or the short hash (first 7 characters) of the commit.
+Commits are read from the local git object store, so make sure they are fetched
+(git fetch upstream) or use --remote to download the configs from GitHub instead.
+
+Several commits, or ranges like v1..v2, can be given at once: each consecutive
+pair of commits that changed the config is compared.
 '''
-gh_pat = dotenv.get_key('.env', 'GH_PAT')
+
+script_path = os.path.abspath(os.path.dirname(__file__))
+
+
+class GitBlobReader:
+    """Reads files at given commits through one `git cat-file --batch` process."""
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            ["git", "-C", script_path, "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+        )
+
+    def read(self, commit, path):
+        """Returns the content of `path` at `commit`, or None if it is not in the object store."""
+        self.process.stdin.write(f"{commit}:{path}\n".encode())
+        self.process.stdin.flush()
+        header = self.process.stdout.readline().decode().split()
+        # "<object> missing" or "<object> ambiguous" have no content
+        if len(header) != 3:
+            return None
+        data = self.process.stdout.read(int(header[2]))
+        self.process.stdout.read(1)
+        return data if header[1] == "blob" else None
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def get_coins_from_git(reader: GitBlobReader, commit: str, path: str = "utils/coins_config.json") -> set:
+    data = reader.read(commit, path)
+    if data is None:
+        print(f"{path} not found at {commit}, is the commit fetched?")
+        return set()
+    return set(json.loads(data).keys())
+
+
+def expand_commits(commits, path="utils/coins_config.json"):
+    """
+    Expands `old..new` ranges into `old` and every later first parent commit
+    in the range that changed `path`. Ranges without such commits are reported.
+    """
+    expanded = []
+    for commit in commits:
+        if ".." in commit:
+            expanded.append(commit.split("..")[0])
+            r = subprocess.run(
+                ["git", "-C", script_path, "rev-list", "--reverse", "--first-parent", commit, "--", f":/{path}"],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            if not r.stdout.split():
+                print(f"No changes to {path} in {commit}")
+            expanded += r.stdout.split()
+        else:
+            expanded.append(commit)
+    return expanded
+
 
 def get_coins_from_commit(commit: str, org: str = "komodoplatform", repo: str = "coins") -> set:
+    import requests
+    import dotenv
+
+    gh_pat = dotenv.get_key('.env', 'GH_PAT')
     url = build_coins_config_url(commit, org="komodoplatform", repo="coins")
-    headers = {'Authorization': f'token {gh_pat}'}
+    headers = {'Authorization': f'token {gh_pat}'} if gh_pat else {}
     print(f"Fetching coins from {url}")
-    r = requests.get(url)
+    r = requests.get(url, headers=headers)
     try:
         return set(list(r.json().keys()))
     except Exception as e:
@@ -35,15 +106,69 @@ def get_new_listed_coins(old_coins, new_coins):
     return list(new_coins - old_coins)
 
 
+def canonical(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":"))
+
+
+def get_changed_keys(old_coin, new_coin):
+    """Returns the top level keys set or changed, and the keys removed, in new_coin."""
+    changed = [
+        k for k in new_coin if k not in old_coin or canonical(old_coin[k]) != canonical(new_coin[k])
+    ]
+    removed = [k for k in old_coin if k not in new_coin]
+    return changed, removed
+
+
+def get_coins_delta(old_config, new_config):
+    """
+    Returns the delta that turns the coins config `old_config` into `new_config`:
+    the full config of added coins, the removed coins, and for changed coins the
+    new value of every changed top level key plus the keys that were removed.
+    """
+    old_coins = set(old_config)
+    new_coins = set(new_config)
+    delta = {
+        "added": {i: new_config[i] for i in sorted(get_new_listed_coins(old_coins, new_coins))},
+        "removed": sorted(get_delisted_coins(old_coins, new_coins)),
+        "changed": {},
+    }
+    for coin in sorted(old_coins & new_coins):
+        if canonical(old_config[coin]) == canonical(new_config[coin]):
+            continue
+        changed, removed = get_changed_keys(old_config[coin], new_config[coin])
+        delta["changed"].update(
+            {coin: {"set": {k: new_config[coin][k] for k in changed}, "unset": removed}}
+        )
+    return delta
+
+
 if __name__ == "__main__":
 
-    parser = argparse.ArgumentParser(description='Returns the add/remove list of coins between two commits.')
-    parser.add_argument('old_commit', type=str, help='Old commit hash')
-    parser.add_argument('new_commit', type=str, help='New commit hash')
+    parser = argparse.ArgumentParser(description='Returns the add/remove list of coins between commits.')
+    parser.add_argument('commits', nargs='+', help='Commit hashes or old..new ranges, oldest first')
+    parser.add_argument('--path', default='utils/coins_config.json', help='Config file to compare, relative to the repo root')
+    parser.add_argument('--remote', action='store_true', help='Download utils/coins_config.json from GitHub instead of reading local git objects')
     # Parse the argument
     args = parser.parse_args()
-    old_coins = get_coins_from_commit(args.old_commit)
-    new_coins = get_coins_from_commit(args.new_commit)
+    if args.remote and any(".." in i for i in args.commits):
+        parser.error("commit ranges need local git history, they can't be used with --remote")
+    commits = args.commits if args.remote else expand_commits(args.commits, args.path)
+    if len(commits) < 2:
+        if any(".." in i for i in args.commits):
+            # The range had no config changes, there is nothing to compare.
+            sys.exit(0)
+        parser.error("at least two commits are needed to compare")
+
+    if args.remote:
+        coins = [get_coins_from_commit(i) for i in commits]
+    else:
+        reader = GitBlobReader()
+        coins = [get_coins_from_git(reader, i, args.path) for i in commits]
+        reader.close()
 
-    print(f"New coin listings: {get_new_listed_coins(old_coins, new_coins)}")
-    print(f"Delisted coins: {get_delisted_coins(old_coins, new_coins)}")
+    for i in range(1, len(commits)):
+        old_coins, new_coins = coins[i - 1], coins[i]
+        if len(commits) > 2:
+            print(f"\n{commits[i - 1][:7]}..{commits[i][:7]}")
+        print(f"New coin listings: {sorted(get_new_listed_coins(old_coins, new_coins))}")
+        print(f"Delisted coins: {sorted(get_delisted_coins(old_coins, new_coins))}")
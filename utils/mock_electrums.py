@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+import ssl
+import sys
+import json
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+
+'''
+Local stand-in for a fleet of ElectrumX servers, to benchmark and test
+scan_electrums.py without the internet.
+
+Endpoints listen on loopback addresses (127.0.x.y, Linux routes all of
+127.0.0.0/8 to lo), --ports-per-host of them on each address, so per host
+limits and TLS session resumption in the scanner apply as they would to
+real servers. Endpoints cycle through TCP, SSL (self-signed cert, made with
+the openssl CLI) and WSS, and each is given one behaviour, picked with the
+seed:
+
+    ok              replies after --latency-ms, +/- --jitter-ms
+    drop            closes the connection when a request arrives
+    silent          accepts requests and never replies
+    malformed       replies with truncated JSON
+    slow_handshake  delays the TLS handshake (SSL), the websocket upgrade
+                    (WSS) or the first reply (TCP) by --slow-handshake-ms
+
+Once listening, the fleet's electrums are printed as one JSON line,
+{coin: [electrum, ...]} in the electrums/ file format, and it serves until
+interrupted.
+
+    ./mock_electrums.py --endpoints 3000 --drop-rate 0.05 --malformed-rate 0.02
+    ./mock_electrums.py --endpoints 300 --ports-per-host 100    # like electrum{1,2,3}.cipig.net
+'''
+
+BASE_HEIGHT = 1000000
+# Share of endpoints reporting a height a few blocks behind the others
+LAGGING_RATE = 0.1
+
+
+class MockEndpoint:
+    __slots__ = ("host", "port", "protocol", "behaviour", "height")
+
+    def __init__(self, host, protocol, behaviour, height):
+        self.host = host
+        self.port = None
+        self.protocol = protocol
+        self.behaviour = behaviour
+        self.height = height
+
+
+def reply_to(request, height):
+    """ElectrumX style reply to a JSON-RPC request."""
+    method = request.get("method")
+    if method == "server.version":
+        result = ["ElectrumX 1.16.0", "1.4"]
+    elif method == "blockchain.headers.subscribe":
+        result = {"hex": "00" * 80, "height": height}
+    elif method == "server.ping":
+        result = None
+    else:
+        return {"jsonrpc": "2.0", "id": request.get("id"), "error": {"code": -32601, "message": f"unknown method {method}"}}
+    return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+
+
+def make_ssl_context(path):
+    """Returns a server context with a self-signed certificate created in `path`."""
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "2",
+            "-subj", "/CN=localhost", "-keyout", f"{path}/key.pem", "-out", f"{path}/cert.pem",
+        ],
+        capture_output=True,
+        check=True,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(f"{path}/cert.pem", f"{path}/key.pem")
+    return context
+
+
+class MockElectrumFleet:
+    def __init__(
+        self, endpoints=100, protocols=("tcp", "ssl", "wss"), servers_per_coin=4, latency_ms=20, jitter_ms=10,
+        drop_rate=0.0, silent_rate=0.0, malformed_rate=0.0, slow_handshake_rate=0.0, slow_handshake_ms=2000, seed=0,
+        ports_per_host=1
+    ):
+        self.rng = random.Random(seed)
+        self.ports_per_host = ports_per_host
+        self.protocols = protocols
+        self.servers_per_coin = servers_per_coin
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slow_handshake_ms = slow_handshake_ms
+        self.rates = [
+            ("drop", drop_rate),
+            ("silent", silent_rate),
+            ("malformed", malformed_rate),
+            ("slow_handshake", slow_handshake_rate),
+        ]
+        self.endpoints = [self.new_endpoint(i) for i in range(endpoints)]
+        self.servers = []
+        self.ssl_context = None
+
+    def new_endpoint(self, i):
+        n = i // self.ports_per_host
+        host = f"127.0.{n // 250 + 1}.{n % 250 + 1}"
+        protocol = self.protocols[i % len(self.protocols)]
+        x = self.rng.random()
+        behaviour = "ok"
+        for name, rate in self.rates:
+            if x < rate:
+                behaviour = name
+                break
+            x -= rate
+        height = BASE_HEIGHT
+        if self.rng.random() < LAGGING_RATE:
+            height -= self.rng.randint(1, 5)
+        return MockEndpoint(host, protocol, behaviour, height)
+
+    async def start(self, cert_path):
+        self.ssl_context = make_ssl_context(cert_path)
+        for endpoint in self.endpoints:
+            if endpoint.protocol == "wss":
+                server = await serve(
+                    lambda websocket, endpoint=endpoint: self.handle_websocket(endpoint, websocket),
+                    endpoint.host, 0, ssl=self.ssl_context, process_request=self.upgrade_delay(endpoint),
+                    max_queue=None,
+                )
+            else:
+                server = await asyncio.start_server(
+                    lambda reader, writer, endpoint=endpoint: self.handle_stream(endpoint, reader, writer),
+                    endpoint.host, 0,
+                )
+            endpoint.port = server.sockets[0].getsockname()[1]
+            self.servers.append(server)
+
+    async def stop(self):
+        for server in self.servers:
+            server.close()
+        for server in self.servers:
+            await server.wait_closed()
+
+    def get_electrums(self):
+        """Returns the fleet as {coin: [electrum, ...]}, in the electrums/ file format."""
+        electrums = {}
+        for i, endpoint in enumerate(self.endpoints):
+            address = f"{endpoint.host}:{endpoint.port}"
+            if endpoint.protocol == "wss":
+                electrum = {"ws_url": address}
+            elif endpoint.protocol == "ssl":
+                electrum = {"url": address, "protocol": "SSL"}
+            else:
+                electrum = {"url": address}
+            electrums.setdefault(f"MOCK{i // self.servers_per_coin + 1}", []).append(electrum)
+        return electrums
+
+    def get_behaviours(self):
+        counts = {}
+        for endpoint in self.endpoints:
+            counts[endpoint.behaviour] = counts.get(endpoint.behaviour, 0) + 1
+        return counts
+
+    async def respond(self, endpoint, data):
+        """Returns the reply to one request message, or None to drop the connection."""
+        if endpoint.behaviour == "drop":
+            return None
+        if endpoint.behaviour == "silent":
+            await asyncio.sleep(3600)
+        latency = self.latency_ms + self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+        await asyncio.sleep(max(0, latency) / 1000)
+        if endpoint.behaviour == "malformed":
+            return b'{"jsonrpc": "2.0", "id": 0, "result": {"hex": "00'
+        request = json.loads(data)
+        if isinstance(request, list):
+            reply = [reply_to(i, endpoint.height) for i in request]
+        else:
+            reply = reply_to(request, endpoint.height)
+        return json.dumps(reply).encode()
+
+    async def handle_stream(self, endpoint, reader, writer):
+        try:
+            if endpoint.behaviour == "slow_handshake":
+                await asyncio.sleep(self.slow_handshake_ms / 1000)
+            if endpoint.protocol == "ssl":
+                await writer.start_tls(self.ssl_context)
+            while line := await reader.readline():
+                reply = await self.respond(endpoint, line)
+                if reply is None:
+                    break
+                writer.write(reply + b"\n")
+                await writer.drain()
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    def upgrade_delay(self, endpoint):
+        async def process_request(connection, request):
+            if endpoint.behaviour == "slow_handshake":
+                await asyncio.sleep(self.slow_handshake_ms / 1000)
+        return process_request
+
+    async def handle_websocket(self, endpoint, websocket):
+        try:
+            async for message in websocket:
+                reply = await self.respond(endpoint, message)
+                if reply is None:
+                    return
+                await websocket.send(reply.decode())
+        except ConnectionClosed:
+            pass
+
+
+def raise_open_files_limit():
+    """Every endpoint holds a listening socket, so allow as many files as the hard limit."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def run_fleet(fleet):
+    with tempfile.TemporaryDirectory() as path:
+        await fleet.start(path)
+    print(json.dumps(fleet.get_electrums()), flush=True)
+    print(f"Serving {len(fleet.endpoints)} endpoints: {fleet.get_behaviours()}", file=sys.stderr, flush=True)
+    try:
+        await asyncio.Future()
+    finally:
+        await fleet.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves a fleet of mock ElectrumX endpoints on loopback addresses.")
+    parser.add_argument("--endpoints", type=int, default=100, help="Number of endpoints, spread over TCP, SSL and WSS")
+    parser.add_argument("--protocols", default="tcp,ssl,wss", help="Comma separated protocols to cycle through")
+    parser.add_argument("--servers-per-coin", type=int, default=4, help="Endpoints listed per mock coin")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Mean delay before each reply")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="Max random deviation from the mean delay")
+    parser.add_argument("--drop-rate", type=float, default=0, help="Share of endpoints closing the connection on request")
+    parser.add_argument("--silent-rate", type=float, default=0, help="Share of endpoints never replying")
+    parser.add_argument("--malformed-rate", type=float, default=0, help="Share of endpoints replying with invalid JSON")
+    parser.add_argument("--slow-handshake-rate", type=float, default=0, help="Share of endpoints with a slow handshake")
+    parser.add_argument("--slow-handshake-ms", type=float, default=2000, help="Handshake delay of slow endpoints")
+    parser.add_argument("--ports-per-host", type=int, default=1, help="Endpoints sharing each loopback address")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    raise_open_files_limit()
+    fleet = MockElectrumFleet(
+        args.endpoints, tuple(args.protocols.split(",")), args.servers_per_coin, args.latency_ms, args.jitter_ms,
+        args.drop_rate, args.silent_rate, args.malformed_rate, args.slow_handshake_rate, args.slow_handshake_ms, args.seed,
+        args.ports_per_host
+    )
+    try:
+        asyncio.run(run_fleet(fleet))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+import os
+import json
+
+
+'''
+Load-once cache for the JSON files in this repo (electrums/, ethereum/,
+tendermint/, explorers/, api_ids/ etc).
+
+Each file is parsed at most once per run, keyed by path and mtime, and
+every caller gets the same read-only object: dicts are FrozenDicts and
+lists are tuples. Copy before modifying (dict(data), deepcopy(data)).
+'''
+
+cache = {}
+stats = {"hits": 0, "misses": 0}
+
+
+class FrozenDict(dict):
+    """Read-only dict. Copies made with deepcopy or dict() are mutable."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("repo data is read-only, copy it before modifying")
+
+    __setitem__ = _readonly
+    __delitem__ = _readonly
+    clear = _readonly
+    pop = _readonly
+    popitem = _readonly
+    setdefault = _readonly
+    update = _readonly
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+def freeze(data):
+    if isinstance(data, dict):
+        return FrozenDict({k: freeze(v) for k, v in data.items()})
+    if isinstance(data, list):
+        return tuple(freeze(i) for i in data)
+    return data
+
+
+def thaw(data):
+    if isinstance(data, dict):
+        return {k: thaw(v) for k, v in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [thaw(i) for i in data]
+    return data
+
+
+def load_json(path):
+    """Returns the parsed, read-only content of the JSON file at `path`."""
+    key = (path, os.stat(path).st_mtime_ns)
+    if key in cache:
+        stats["hits"] += 1
+        return cache[key]
+    stats["misses"] += 1
+    with open(path, "r") as f:
+        data = freeze(json.load(f))
+    cache.update({key: data})
+    return data
+
+
+def get_stats():
+    return dict(stats, files=len(cache))
@@ -4,9 +4,11 @@ import sys
 import ssl
 import json
 import time
+import hashlib
+import functools
 import socket
-import threading
 import asyncio
+import argparse
 from websockets.asyncio.client import connect
 from logger import logger
 
@@ -18,10 +20,29 @@ passed_electrums_ssl = {}
 failed_electrums_ssl = {}
 passed_electrums_wss = {}
 failed_electrums_wss = {}
-socket.setdefaulttimeout(10)
+scan_results = {
+    "tcp": (passed_electrums, failed_electrums),
+    "ssl": (passed_electrums_ssl, failed_electrums_ssl),
+    "wss": (passed_electrums_wss, failed_electrums_wss),
+}
+# Timings and height of each passed server, keyed by (coin, protocol, server).
+server_metrics = {}
+# Max number of servers probed at once by the scanner.
+SCAN_CONCURRENCY = 200
+# Max number of servers probed at once on the same hostname.
+PER_HOST_CONCURRENCY = 4
+# Endpoints timing out on connect, with none connecting, after which a host's probes are not limited.
+HOST_TIMEOUT_LIMIT = 3
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 7
+# Hard limit for a whole probe (connect, handshake and request).
+PROBE_DEADLINE = CONNECT_TIMEOUT + 2 * READ_TIMEOUT
+# Max size of a single JSON-RPC message read from a server.
+STREAM_LIMIT = 2 ** 23
+# In incremental mode, servers which passed more recently than this are not probed again.
+INCREMENTAL_MAX_AGE = 3 * 86400
 script_path = os.path.abspath(os.path.dirname(__file__))
 repo_path = script_path.replace("/utils", "")
-os.chdir(script_path)
 
 
 def colorize(string, color):
@@ -36,8 +57,46 @@ def colorize(string, color):
             return colors[color] + str(string) + '\033[0m'
 
 
+class ResumingSSLContext(ssl.SSLContext):
+    """
+    Client SSLContext which offers the last TLS session seen for a host when
+    connecting to it again, so repeat handshakes to the same operator
+    (e.g. the electrum{1,2,3}.cipig.net fleet, shared by many coins) are
+    abbreviated.
+    """
+    def __new__(cls, *args, **kwargs):
+        self = super().__new__(cls, *args, **kwargs)
+        self.sessions = {}
+        self.stats = {"handshakes": 0, "resumed": 0}
+        return self
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname, session)
+
+    def save_session(self, host, ssl_object):
+        self.stats["handshakes"] += 1
+        if ssl_object.session_reused:
+            self.stats["resumed"] += 1
+        if ssl_object.session is not None:
+            self.sessions.update({host: ssl_object.session})
+
+
+@functools.cache
+def get_ssl_context(verify=False):
+    """Returns the process wide client context for a verification policy."""
+    context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    else:
+        context.load_default_certs()
+    return context
+
+
 class ElectrumServer:
-    __slots__ = ("coin", "url", "port", "protocol", "result", "blockheight", "last_connection")
+    __slots__ = ("coin", "url", "port", "protocol", "result", "blockheight", "last_connection", "timings")
     
     def __init__(self, coin, url, port, protocol):
         self.coin = coin
@@ -47,230 +106,325 @@ class ElectrumServer:
         self.result = None
         self.blockheight = -1
         self.last_connection = -1
+        self.timings = {}
 
-    def tcp(self, method, params=None):
-        if params:
-            params = [params] if type(params) is not list else params
+    async def query(self, method, params=None, resolver=None):
+        """Sends the server.version handshake and `method` pipelined over one connection."""
         try:
-            with socket.create_connection((self.url, self.port)) as sock:
-                # Handshake
-                payload = {"id": 0, "method": "server.version", "params": ["kmd_coins_repo", ["1.4", "1.6"]]}
-                sock.send(json.dumps(payload).encode() + b'\n')
-                time.sleep(1)
-                resp = sock.recv(999999)[:-1].decode()
-                # logger.info(f"TCP {self.url}:{self.port} {resp}")
-                # Request
-                payload = {"id": 0, "method": method}
-                if params:
-                    payload.update({"params": params})
-                sock.send(json.dumps(payload).encode() + b'\n')
-                time.sleep(1)
-                resp = sock.recv(999999)[:-1].decode()
-                resp = resp.splitlines()
-                if len(resp) > 0:
-                    resp = resp[-1]
+            session = ElectrumSession(self.url, self.port, self.protocol, resolver)
+            # Timings are kept even if the connection fails part way.
+            self.timings = session.timings
+            async with session:
+                version, resp = await session.batch([
+                    ("server.version", ["kmd_coins_repo", ["1.4", "1.6"]]),
+                    (method, params)
+                ])
+                # logger.info(f"{self.protocol} {self.url}:{self.port} {version}")
                 return resp
+        except asyncio.TimeoutError:
+            return TimeoutError("Timed out")
         except Exception as e:
             return e
 
-    def ssl(self, method, params=None):
-        if params:
-            params = [params] if type(params) is not list else params
-        context = ssl.SSLContext(verify_mode=ssl.CERT_NONE)
-        try:
-            with socket.create_connection((self.url, self.port)) as sock:
-                with context.wrap_socket(sock, server_hostname=self.url) as ssock:
-                    # Handshake
-                    payload = {"id": 0, "method": "server.version", "params": ["kmd_coins_repo", ["1.4", "1.6"]]}
-                    ssock.send(json.dumps(payload).encode() + b'\n')
-                    time.sleep(1)
-                    resp = ssock.recv(999999)[:-1].decode()
-                    # logger.info(f"SSL {self.url}:{self.port} {resp}")
-                    # Request                    
-                    payload = {"id": 0, "method": method}
-                    if params:
-                        payload.update({"params": params})
-                    ssock.send(json.dumps(payload).encode() + b'\n')
-                    time.sleep(1)
-                    resp = ssock.recv(999999)[:-1].decode()
-                    resp = resp.splitlines()
-                    if len(resp) > 0:
-                        resp = resp[-1]
-                    return resp
-        except Exception as e:
-            return e
 
-    def wss(self, method, params=None):    
-        if params:
-            params = [params] if type(params) is not list else params
-        
-        ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-        ssl_context.check_hostname = False
-        ssl_context.verify_mode = ssl.CERT_NONE
-
-        try:
-            async def connect_and_query():
-                async with connect(f"wss://{self.url}:{self.port}", ssl=ssl_context, open_timeout=10, close_timeout=10, ping_timeout=10) as websocket:
-                    # Handshake
-                    payload = {"id": 0, "method": "server.version", "params": ["kmd_coins_repo", ["1.4", "1.6"]]}
-                    await websocket.send(json.dumps(payload))
-                    await asyncio.sleep(1)
-                    resp = await asyncio.wait_for(websocket.recv(), timeout=7)
-                    payload = {"id": 0, "method": method}
-                    if params:
-                        payload.update({"params": params})
-                    await websocket.send(json.dumps(payload))
-                    await asyncio.sleep(1)
-                    resp = await asyncio.wait_for(websocket.recv(), timeout=7)
-                    resp = resp.splitlines()
-                    if len(resp) > 0:
-                        resp = resp[-1]
-                    return resp
-            
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            response = loop.run_until_complete(connect_and_query())
-            return response
-        except Exception as e:
-            return e
-
-
-def get_from_electrum(url, port, method, params=None):
-    if 'cipig.net' in url:
-        return '{"result": "cipig.net is always welcome."}'
-    if params:
-        params = [params] if type(params) is not list else params
-    try:
-        with socket.create_connection((url, port)) as sock:
-            payload = {"id": 0, "method": method}
+class ElectrumSession:
+    """
+    Persistent JSON-RPC connection to a single electrum server. Calls made
+    with `batch` are pipelined, so any number of methods costs one TCP
+    (and TLS / websocket) handshake.
+    """
+    def __init__(self, url, port, protocol="tcp", resolver=None):
+        self.url = url
+        self.port = port
+        self.protocol = protocol.lower()
+        self.resolver = resolver
+        self.reader = None
+        self.writer = None
+        self.websocket = None
+        self.next_id = 0
+        # Replies which arrived while waiting for another id.
+        self.replies = {}
+        # Serialises batches from callers sharing the session.
+        self.lock = asyncio.Lock()
+        # Milliseconds spent on the TCP connect, the TLS handshake (plus the
+        # websocket upgrade for WSS) and waiting for the first reply.
+        self.timings = {"connect_ms": None, "tls_ms": None, "first_response_ms": None}
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def connect(self):
+        """Connects to the first reachable address of the server."""
+        addresses = [self.url]
+        if self.resolver:
+            addresses = await self.resolver.resolve(self.url)
+        for i, address in enumerate(addresses):
+            try:
+                return await self.connect_address(address)
+            except OSError:
+                if i == len(addresses) - 1:
+                    raise
+
+    async def connect_address(self, address):
+        # TCP connect and TLS handshake are done as separate steps so each can be timed.
+        start = time.perf_counter()
+        if self.protocol == "wss":
+            loop = asyncio.get_running_loop()
+            family, type_, proto, _, sockaddr = (await loop.getaddrinfo(address, self.port, type=socket.SOCK_STREAM))[0]
+            sock = socket.socket(family, type_, proto)
+            sock.setblocking(False)
+            try:
+                await asyncio.wait_for(loop.sock_connect(sock, sockaddr), timeout=CONNECT_TIMEOUT)
+                self.timings["connect_ms"] = elapsed_ms(start)
+                start = time.perf_counter()
+                self.websocket = await connect(
+                    f"wss://{self.url}:{self.port}", sock=sock, ssl=get_ssl_context(), open_timeout=CONNECT_TIMEOUT,
+                    close_timeout=10, ping_timeout=10, max_size=STREAM_LIMIT
+                )
+            except BaseException:
+                sock.close()
+                raise
+            self.timings["tls_ms"] = elapsed_ms(start)
+            return
+
+        self.reader, self.writer = await asyncio.wait_for(
+            asyncio.open_connection(address, self.port, limit=STREAM_LIMIT), timeout=CONNECT_TIMEOUT
+        )
+        self.timings["connect_ms"] = elapsed_ms(start)
+        if self.protocol == "ssl":
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(
+                    self.writer.start_tls(get_ssl_context(), server_hostname=self.url), timeout=CONNECT_TIMEOUT
+                )
+            except BaseException:
+                self.writer.close()
+                raise
+            self.timings["tls_ms"] = elapsed_ms(start)
+
+    async def close(self):
+        # Session tickets arrive after the handshake, so they are saved once the connection has been used.
+        ssl_object = None
+        if self.websocket:
+            ssl_object = self.websocket.transport.get_extra_info("ssl_object")
+        elif self.writer:
+            ssl_object = self.writer.get_extra_info("ssl_object")
+        if ssl_object:
+            get_ssl_context().save_session(self.url, ssl_object)
+
+        if self.websocket:
+            await self.websocket.close()
+        if self.writer:
+            self.writer.close()
+
+    async def read_message(self):
+        if self.websocket:
+            return await self.websocket.recv()
+        return await self.reader.readline()
+
+    async def batch(self, calls):
+        """Pipelines `calls`, a list of (method, params) tuples, and returns the raw replies in the same order."""
+        payloads = []
+        for method, params in calls:
+            payload = {"id": self.next_id, "method": method}
             if params:
-                payload.update({"params": params})
-            sock.send(json.dumps(payload).encode() + b'\n')
-            time.sleep(3)
-            resp = sock.recv(999999)[:-1].decode()
-            return resp
+                payload.update({"params": [params] if type(params) is not list else params})
+            payloads.append(payload)
+            self.next_id += 1
+
+        async with self.lock:
+            start = time.perf_counter()
+            if self.websocket:
+                for payload in payloads:
+                    await self.websocket.send(json.dumps(payload))
+            else:
+                self.writer.write(b"".join(json.dumps(payload).encode() + b'\n' for payload in payloads))
+                await self.writer.drain()
+            replies = []
+            for payload in payloads:
+                replies.append(await read_response(self.read_message, payload["id"], replies=self.replies))
+                if self.timings["first_response_ms"] is None:
+                    self.timings["first_response_ms"] = elapsed_ms(start)
+            return replies
+
+    async def request(self, method, params=None):
+        return (await self.batch([(method, params)]))[0]
+
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000)
+
+
+class HostResolver:
+    """Resolves each hostname once and shares the addresses between all connections to it."""
+    def __init__(self):
+        self.addresses = {}
+
+    async def resolve(self, host):
+        if host not in self.addresses:
+            self.addresses[host] = asyncio.ensure_future(self.lookup(host))
+        # Shielded so a probe hitting its deadline does not cancel the lookup for the others.
+        return await asyncio.shield(self.addresses[host])
+
+    async def lookup(self, host):
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        return list(dict.fromkeys(info[4][0] for info in infos))
+
+
+async def read_response(read_message, msg_id, timeout=READ_TIMEOUT, replies=None):
+    """
+    Reads JSON-RPC messages until the one answering `msg_id` arrives.
+    `read_message` returns one framed message per call (a newline terminated
+    line for TCP/SSL streams, a frame for websockets). Notifications are
+    skipped, and replies to other ids are kept in `replies` if given.
+    Returns an empty string if the server closes the connection, or raises
+    TimeoutError once `timeout` seconds have passed without a matching reply.
+    """
+    if replies and msg_id in replies:
+        return replies.pop(msg_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        data = await asyncio.wait_for(read_message(), timeout=remaining)
+        if isinstance(data, bytes):
+            data = data.decode()
+        if not data:
+            return ""
+        for line in data.splitlines():
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                # Not JSON, let parse_response report it.
+                return line
+            if isinstance(msg, dict) and msg.get("id") == msg_id:
+                return line
+            if isinstance(msg, dict) and "id" in msg and replies is not None:
+                replies.update({msg["id"]: line})
+
+
+async def query_electrum(url, port, protocol, calls):
+    """Runs `calls` over a single connection, returning the raw replies (or the connection error for each)."""
+    try:
+        async with ElectrumSession(url, port, protocol) as session:
+            return await session.batch(calls)
+    except asyncio.TimeoutError:
+        return [TimeoutError("Timed out")] * len(calls)
     except Exception as e:
-        return e
+        return [e] * len(calls)
 
 
-def get_from_electrum_ssl(url, port, method, params=None):
+def get_many_from_electrum(url, port, calls, protocol="tcp"):
+    """Sync wrapper for query_electrum, e.g. to fetch version, tip and fee estimate with one handshake."""
     if 'cipig.net' in url:
-        return '{"result": "cipig.net is always welcome."}'
-    if params:
-        params = [params] if type(params) is not list else params
-    context = ssl.SSLContext(verify_mode=ssl.CERT_NONE)
-    try:
-        with socket.create_connection((url, port)) as sock:
-            with context.wrap_socket(sock, server_hostname=url) as ssock:
-                payload = {"id": 0, "method": method}
-                if params:
-                    payload.update({"params": params})
-                ssock.send(json.dumps(payload).encode() + b'\n')
-                time.sleep(3)
-                resp = ssock.recv(999999)[:-1].decode()
-                return resp
-    except Exception as e:
-        return e
+        return ['{"result": "cipig.net is always welcome."}'] * len(calls)
+    return asyncio.run(query_electrum(url, port, protocol, calls))
 
 
-def get_from_electrum_wss(url, port, method, params=None):
-    if 'cipig.net' in url:
-        return '{"result": "cipig.net is always welcome."}'
-    
-    if params:
-        params = [params] if type(params) is not list else params
-    
-    ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
+def get_from_electrum(url, port, method, params=None):
+    return get_many_from_electrum(url, port, [(method, params)], "tcp")[0]
 
-    try:
-        async def connect_and_query():
-            async with connect(f"wss://{url}:{port}", ssl=ssl_context, open_timeout=10, close_timeout=10, ping_timeout=10) as websocket:
-                payload = {"id": 0, "method": method}
-                if params:
-                    payload.update({"params": params})
-                await websocket.send(json.dumps(payload))
-                await asyncio.sleep(3)
-                resp = await asyncio.wait_for(websocket.recv(), timeout=7)
-                return resp
-        
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response = loop.run_until_complete(connect_and_query())
-        return response
-    except Exception as e:
-        return e
 
+def get_from_electrum_ssl(url, port, method, params=None):
+    return get_many_from_electrum(url, port, [(method, params)], "ssl")[0]
 
-class scan_thread(threading.Thread):
-    def __init__(self, coin, url, port, method, params=None, protocol='tcp'):
-        threading.Thread.__init__(self)
-        self.coin = coin
-        self.url = url
-        self.port = port
-        self.method = method
-        self.params = params
-        self.protocol = protocol
 
-    def run(self):
-        if self.protocol == "ssl":
-            thread_electrum_ssl(self.coin, self.url, self.port, self.method, self.params)
-        elif self.protocol == "tcp":
-            thread_electrum(self.coin, self.url, self.port, self.method, self.params)
-        elif self.protocol == "wss":
-            thread_electrum_wss(self.coin, self.url, self.port, self.method, self.params)
+def get_from_electrum_wss(url, port, method, params=None):
+    return get_many_from_electrum(url, port, [(method, params)], "wss")[0]
+
+
+class HostSlots:
+    """
+    Limits the probes in flight on one host. The limit is lifted while the
+    host looks blackholed: HOST_TIMEOUT_LIMIT of its endpoints timed out on
+    connect and none has connected during this scan. Its queued probes then
+    run at once, so each does not wait out a slot. Every endpoint is still
+    probed, so live ports next to firewalled ones on the same host pass.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.timed_out = set()
+        self.connected = False
+        self.changed = asyncio.Condition()
+
+    def is_blackholed(self):
+        return not self.connected and len(self.timed_out) >= HOST_TIMEOUT_LIMIT
+
+    def record_connect(self, port, timed_out):
+        if timed_out:
+            self.timed_out.add(port)
+        else:
+            self.connected = True
 
+    async def __aenter__(self):
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.in_flight < self.limit or self.is_blackholed())
+            self.in_flight += 1
 
-def thread_electrum_wss(coin, url, port, method, params):
-    x = ElectrumServer(coin, url, port, "WSS")
-    resp = x.wss(method, params)
-    el = parse_response(x, resp)
+    async def __aexit__(self, *exc):
+        async with self.changed:
+            self.in_flight -= 1
+            self.changed.notify_all()
 
-    if el.blockheight > 0:
-        if coin not in passed_electrums_wss:
-            passed_electrums_wss.update({coin:[]})
-        passed_electrums_wss[coin].append(f"{url}:{port}")
-        logger.calc(f"[WSS] {coin} {url}:{port} OK! Height: {el.blockheight}")
-    else:
-        if coin not in failed_electrums_wss:
-            failed_electrums_wss.update({coin:{}})
-        failed_electrums_wss[coin].update({f"{url}:{port}": f"{el.result}"})
-        logger.warning(f"[WSS] {coin} {url}:{port} Failed! {el.result}")
 
+class ScanLimits:
+    """Global and per host limits on the number of probes in flight."""
+    def __init__(self, concurrency=SCAN_CONCURRENCY, per_host=PER_HOST_CONCURRENCY):
+        self.all = asyncio.Semaphore(concurrency)
+        self.per_host = per_host
+        self.hosts = {}
 
-def thread_electrum(coin, url, port, method, params):
-    x = ElectrumServer(coin, url, port, "TCP")
-    resp = x.tcp(method, params)
-    el = parse_response(x, resp)
+    def host(self, url):
+        if url not in self.hosts:
+            self.hosts[url] = HostSlots(self.per_host)
+        return self.hosts[url]
 
-    if el.blockheight > 0:
-        if coin not in passed_electrums:
-            passed_electrums.update({coin:[]})
-        passed_electrums[coin].append(f"{url}:{port}")
-        logger.calc(f"[TCP] {coin} {url}:{port} OK! Height: {el.blockheight}")
-    else:
-        if coin not in failed_electrums:
-            failed_electrums.update({coin:{}})
-        failed_electrums[coin].update({f"{url}:{port}": f"{el.result}"})
-        logger.warning(f"[TCP] {coin} {url}:{port} Failed! | {el.result}")
 
+async def scan_electrum(coins, url, port, method, params, protocol, limits, resolver, events):
+    """Probes one endpoint and records the result for every coin listing it."""
+    try:
+        # The host slot is taken first, so probes queued behind a busy host do not hold global slots.
+        host = limits.host(url)
+        async with host:
+            x = ElectrumServer(coins[0], url, port, protocol.upper())
+            async with limits.all:
+                try:
+                    resp = await asyncio.wait_for(x.query(method, params, resolver), timeout=PROBE_DEADLINE)
+                except asyncio.TimeoutError:
+                    resp = TimeoutError("Timed out")
+            # A timeout before connect_ms was set is a connect timeout.
+            host.record_connect(port, isinstance(resp, TimeoutError) and x.timings.get("connect_ms") is None)
+        for coin in coins:
+            el = parse_response(ElectrumServer(coin, url, port, protocol.upper()), resp)
+            el.timings = x.timings
+            record_result(coin, url, port, protocol, el)
+    finally:
+        for coin in coins:
+            events.put_nowait((coin, protocol))
+
+
+def record_result(coin, url, port, protocol, el):
+    passed, failed = scan_results[protocol]
 
-def thread_electrum_ssl(coin, url, port, method, params):
-    x = ElectrumServer(coin, url, port, "SSL")
-    resp = x.ssl(method, params)
-    el = parse_response(x, resp)
-    
     if el.blockheight > 0:
-        if coin not in passed_electrums_ssl:
-            passed_electrums_ssl.update({coin:[]})
-        passed_electrums_ssl[coin].append(f"{url}:{port}")
-        logger.info(f"[SSL] {coin} {url}:{port} OK! Height: {el.blockheight}")
+        if coin not in passed:
+            passed.update({coin:[]})
+        passed[coin].append(f"{url}:{port}")
+        server_metrics.update({(coin, protocol, f"{url}:{port}"): {**el.timings, "blockheight": el.blockheight}})
+        logger.calc(f"[{protocol.upper()}] {coin} {url}:{port} OK! Height: {el.blockheight}")
     else:
-        if coin not in failed_electrums_ssl:
-            failed_electrums_ssl.update({coin:{}})
-        failed_electrums_ssl[coin].update({f"{url}:{port}": f"{el.result}"})
-        logger.warning(f"[SSL] {coin} {url}:{port} Failed! | {el.result}")
+        if coin not in failed:
+            failed.update({coin:{}})
+        failed[coin].update({f"{url}:{port}": f"{el.result}"})
+        logger.warning(f"[{protocol.upper()}] {coin} {url}:{port} Failed! | {el.result}")
 
 
 def parse_response(el_obj, resp):
@@ -315,10 +469,15 @@ def parse_response(el_obj, resp):
         return el_obj
     except Exception as e:
         logger.error(f"[{el_obj.protocol}] Error parsing {el_obj.coin} {el_obj.url} {el_obj.port} | Response: [{e}] {resp}")
+        if not isinstance(el_obj.result, str):
+            el_obj.result = "Invalid response"
+        return el_obj
 
 
-def scan_electrums(electrum_dict):
-    thread_list = []
+def scan_electrums(electrum_dict, concurrency=SCAN_CONCURRENCY, skip=None, per_host=PER_HOST_CONCURRENCY):
+    """Probes every electrum in `electrum_dict` except the (coin, protocol, server) tuples in `skip`."""
+    skip = skip or set()
+    probes = []
     protocol_lists = {
         "tcp": [],
         "ssl": [],
@@ -327,54 +486,65 @@ def scan_electrums(electrum_dict):
 
     for coin in electrum_dict:
         for electrum in electrum_dict[coin]:
-                if "ws_url" in electrum:
-                    url, port = electrum["ws_url"].split(":")
-                    protocol_lists['wss'].append(coin)
-                
-                    thread_list.append(
-                        scan_thread(
-                            coin,
-                            url,
-                            port,
-                            "blockchain.headers.subscribe",
-                            [],
-                            "wss"
-                        )
-                    )
-                if 'url' in electrum:
-                    url, port = electrum["url"].split(":")
-                    if "protocol" in electrum:
-                        protocol_lists[electrum["protocol"].lower()].append(coin)
-                        thread_list.append(
-                            scan_thread(
-                                coin,
-                                url,
-                                port,
-                                "blockchain.headers.subscribe",
-                                [],
-                                electrum["protocol"].lower()
-                            )
-                        )
-                    else:
-                        protocol_lists['tcp'].append(coin)
-                        thread_list.append(
-                            scan_thread(
-                                coin,
-                                url,
-                                port,
-                                "blockchain.headers.subscribe",
-                                [],
-                                "tcp"
-                            )
-                        )
-
-        
-    for thread in thread_list:
-        thread.start()
-        time.sleep(0.1)
+            if "ws_url" in electrum and (coin, "wss", electrum["ws_url"]) not in skip:
+                url, port = electrum["ws_url"].split(":")
+                protocol_lists['wss'].append(coin)
+                probes.append((coin, url, port, "blockchain.headers.subscribe", [], "wss"))
+            if 'url' in electrum:
+                protocol = electrum.get("protocol", "tcp").lower()
+                if (coin, protocol, electrum["url"]) in skip:
+                    continue
+                url, port = electrum["url"].split(":")
+                protocol_lists[protocol].append(coin)
+                probes.append((coin, url, port, "blockchain.headers.subscribe", [], protocol))
+
+    asyncio.run(run_scans(probes, concurrency, per_host))
     return protocol_lists
 
 
+async def run_scans(probes, concurrency, per_host=PER_HOST_CONCURRENCY):
+    """
+    Runs every probe in a single event loop, at most `concurrency` at a time
+    and at most `per_host` at a time against the same hostname. Endpoints
+    listed by several coins are probed once. Each probe posts a
+    (coin, protocol) event to a queue once its result is recorded (or its
+    deadline fires), so this returns as soon as the last probe is done.
+    """
+    endpoints = {}
+    for coin, url, port, method, params, protocol in probes:
+        endpoints.setdefault((url, port, method, protocol), []).append(coin)
+
+    limits = ScanLimits(concurrency, per_host)
+    resolver = HostResolver()
+    events = asyncio.Queue()
+    tasks = [
+        asyncio.create_task(scan_electrum(coins, url, port, method, [], protocol, limits, resolver, events))
+        for (url, port, method, protocol), coins in endpoints.items()
+    ]
+    await track_progress(events, probes)
+    await asyncio.gather(*tasks)
+
+
+async def track_progress(events, probes):
+    """Consumes probe completion events and logs per protocol progress as each coin finishes."""
+    pending = {"tcp": {}, "ssl": {}, "wss": {}}
+    for coin, url, port, method, params, protocol in probes:
+        pending[protocol][coin] = pending[protocol].get(coin, 0) + 1
+    totals = {protocol: len(coins) for protocol, coins in pending.items()}
+
+    for _ in range(len(probes)):
+        coin, protocol = await events.get()
+        pending[protocol][coin] -= 1
+        if pending[protocol][coin] > 0:
+            continue
+        del pending[protocol][coin]
+        done = totals[protocol] - len(pending[protocol])
+        pct = round(done / totals[protocol] * 100, 2)
+        logger.query(f"{protocol.upper()} scan progress: {pct}% electrums ({done}/{totals[protocol]})")
+        if 0 < len(pending[protocol]) < 3:
+            logger.query(set(pending[protocol]))
+
+
 def get_repo_electrums():
     electrum_coins = [f for f in os.listdir(f"{repo_path}/electrums") if os.path.isfile(f"{repo_path}/electrums/{f}") and f not in ["TSIA", "ANAGAMI"]]
     repo_electrums = {}
@@ -394,7 +564,7 @@ def get_repo_electrums():
 
 
 def get_existing_report():
-    if os.path.exists("electrum_scan_report.json"):
+    if os.path.exists(f"{script_path}/electrum_scan_report.json"):
         with open(f"{script_path}/electrum_scan_report.json", "r") as f:
             return json.load(f)
     return {}
@@ -409,143 +579,114 @@ def get_last_connection(report, coin, protocol, server):
         return 0
 
 
-
-def get_electrums_report():
+def get_electrums_hash(electrums):
+    return hashlib.sha256(json.dumps(electrums, sort_keys=True).encode()).hexdigest()
+
+
+def get_fresh_servers(report, electrum_dict, current_time, max_age=INCREMENTAL_MAX_AGE):
+    """
+    Returns the report entries which can be reused without probing again, as
+    {coin: {protocol: {server: entry}}}. A server is fresh if it passed less
+    than `max_age` seconds ago and its coin's electrums file is unchanged
+    since the report was written.
+    """
+    fresh = {}
+    for coin, electrums in electrum_dict.items():
+        if coin not in report:
+            continue
+        if report[coin].get("electrums_hash") != get_electrums_hash(electrums):
+            continue
+        for protocol in ["tcp", "ssl", "wss"]:
+            for server, entry in report[coin].get(protocol, {}).items():
+                if entry["result"] == "Passed" and current_time - entry["last_connection"] < max_age:
+                    fresh.setdefault(coin, {}).setdefault(protocol, {}).update({server: entry})
+    return fresh
+
+
+def get_max_height(coin, fresh):
+    """Highest block seen for `coin` in this scan, falling back to the reused report entries."""
+    heights = [v["blockheight"] for k, v in server_metrics.items() if k[0] == coin]
+    if not heights:
+        heights = [
+            entry.get("blockheight", 0)
+            for servers in fresh.get(coin, {}).values()
+            for entry in servers.values()
+        ]
+    return max(heights, default=0)
+
+
+def get_electrums_report(concurrency=SCAN_CONCURRENCY, incremental=False, max_age=INCREMENTAL_MAX_AGE, per_host=PER_HOST_CONCURRENCY):
+    """
+    Scans the repo electrums and writes electrum_scan_report.json. In
+    incremental mode only failed, new or stale servers are probed, and
+    the entries of fresh servers are carried over from the existing report.
+    """
     current_time = int(time.time())
     existing_report = get_existing_report()
     electrum_dict = get_repo_electrums()
-    protocol_lists = scan_electrums(electrum_dict)
-    electrum_coins_ssl = set(protocol_lists['ssl'])
-    electrum_coins = set(protocol_lists['tcp'])
-    electrum_coins_wss = set(protocol_lists['wss'])
-
-    num_electrums = len(electrum_coins) + len(electrum_coins_ssl) + len(electrum_coins_wss)
-    i = 0
-    while True:
-        electrums_set = set(list(passed_electrums.keys()) + list(failed_electrums.keys())) - set(ignore_list)
-        electrums_ssl_set = set(list(passed_electrums_ssl.keys()) + list(failed_electrums_ssl.keys())) - set(ignore_list)
-        electrums_wss_set = set(list(passed_electrums_wss.keys()) + list(failed_electrums_wss.keys())) - set(ignore_list)
-        electrums_pct = round(len(electrums_set) / len(electrum_coins) * 100, 2)
-        electrums_ssl_pct = round(len(electrums_ssl_set) / len(electrum_coins_ssl) * 100, 2)
-        electrums_wss_pct = round(len(electrums_wss_set) / len(electrum_coins_wss) * 100, 2)
-        logger.query(f"TCP scan progress: {electrums_pct}% electrums ({len(electrums_set)}/{len(electrum_coins)})")
-        if len(electrums_set) - len(electrum_coins) < 3:
-            logger.query(electrum_coins.difference(electrums_set))
-        logger.query(f"SSL scan progress: {electrums_ssl_pct}% electrums_ssl ({len(electrums_ssl_set)}/{len(electrum_coins_ssl)})")
-        if len(electrums_ssl_set) - len(electrum_coins_ssl) < 3:
-            logger.query(electrum_coins_ssl.difference(electrums_ssl_set))
-        logger.query(f"WSS scan progress: {electrums_wss_pct}% electrums_wss ({len(electrums_wss_set)}/{len(electrum_coins_wss)})")
-        if len(electrums_wss_set) - len(electrum_coins_wss) < 3:
-            logger.query(electrum_coins_wss.difference(electrums_wss_set))
-            
-        if electrums_set == electrum_coins:
-            if electrums_ssl_set == electrum_coins_ssl:
-                if electrums_wss_set == electrum_coins_wss:
-                    break
-        if i > (num_electrums * 0.1 + 90):
-            print("Loop expired incomplete after 60 iterations.")
-            break
-        i += 1
-        time.sleep(3)
+    fresh = {}
+    if incremental:
+        fresh = get_fresh_servers(existing_report, electrum_dict, current_time, max_age)
+    skip = set(
+        (coin, protocol, server)
+        for coin in fresh
+        for protocol in fresh[coin]
+        for server in fresh[coin][protocol]
+    )
+    if incremental:
+        logger.info(f"Incremental scan: skipping {len(skip)} recently passed electrums")
+    scan_electrums(electrum_dict, concurrency, skip, per_host)
+    tls_stats = get_ssl_context().stats
+    logger.info(f"TLS sessions resumed: {tls_stats['resumed']}/{tls_stats['handshakes']}")
+
+    scanned_coins = set(fresh)
+    for passed, failed in scan_results.values():
+        scanned_coins.update(passed.keys(), failed.keys())
 
     results = {}
-
-    all_electrums = list(electrums_ssl_set.union(electrums_set).union(electrums_wss_set))
-    all_electrums.sort()
-    for coin in all_electrums:
-        if coin in passed_electrums: passed = len(passed_electrums[coin])
-        else: passed =  0
-        if coin in passed_electrums_ssl: passed_ssl = len(passed_electrums_ssl[coin])
-        else: passed_ssl = 0
-        if coin in passed_electrums_wss: passed_wss = len(passed_electrums_wss[coin])
-        else: passed_wss = 0
-        if coin in failed_electrums: failed = len(failed_electrums[coin])
-        else: failed = 0
-        if coin in failed_electrums_ssl: failed_ssl = len(failed_electrums_ssl[coin])
-        else: failed_ssl = 0
-        if coin in failed_electrums_wss: failed_wss = len(failed_electrums_wss[coin])
-        else: failed_wss = 0
-        results.update({
-            coin: {
-                "electrums_total_all": passed + failed + passed_ssl + failed_ssl + passed_wss + failed_wss,
-                "electrums_working_all": passed + passed_ssl + passed_wss,
-                "electrums_total_tcp": passed + failed,
-                "electrums_working_tcp": passed,
-                "electrums_total_ssl": passed_ssl + failed_ssl,
-                "electrums_working_ssl": passed_ssl,
-                "electrums_total_wss": passed_wss + failed_wss,
-                "electrums_working_wss": passed_wss,
-                "tcp": {},
-                "ssl": {},
-                "wss": {}
-            }
-        })
-
-        if coin in passed_electrums:
-            x = list(passed_electrums[coin])
-            x.sort()
-            for i in x:
-                results[coin]["tcp"].update({
+    for coin in sorted(scanned_coins - set(ignore_list)):
+        max_height = get_max_height(coin, fresh)
+        servers = {}
+        for protocol, (passed, failed) in scan_results.items():
+            working = {}
+            for i in passed.get(coin, []):
+                metrics = server_metrics[(coin, protocol, i)]
+                working.update({
                     i: {
                         "last_connection": current_time,
-                        "result": "Passed"
+                        "result": "Passed",
+                        **metrics,
+                        "height_lag": max_height - metrics["blockheight"]
                     }
                 })
-
-        if coin in failed_electrums:
-            x = list(failed_electrums[coin].keys())
-            x.sort()
-            for i in x:
-                results[coin]["tcp"].update({
+            working.update(fresh.get(coin, {}).get(protocol, {}))
+            servers[protocol] = {i: working[i] for i in sorted(working)}
+            for i in sorted(failed.get(coin, {})):
+                servers[protocol].update({
                     i: {
-                        "last_connection": get_last_connection(existing_report, coin, "tcp", i),
-                        "result": failed_electrums[coin][i]
+                        "last_connection": get_last_connection(existing_report, coin, protocol, i),
+                        "result": failed[coin][i]
                     }
                 })
 
-        if coin in passed_electrums_ssl:
-            x = list(passed_electrums_ssl[coin])
-            x.sort()
-            for i in x:
-                results[coin]["ssl"].update({
-                    i: {
-                        "last_connection": current_time,
-                        "result": "Passed"
-                    }
-                })
-
-        if coin in failed_electrums_ssl:
-            x = list(failed_electrums_ssl[coin].keys())
-            x.sort()
-            for i in x:
-                results[coin]["ssl"].update({
-                    i: {
-                        "last_connection": get_last_connection(existing_report, coin, "ssl", i),
-                        "result": failed_electrums_ssl[coin][i]
-                    }
-                })
-
-        if coin in passed_electrums_wss:
-            x = list(passed_electrums_wss[coin])
-            x.sort()
-            for i in x:
-                results[coin]["wss"].update({
-                    i: {
-                        "last_connection": current_time,
-                        "result": "Passed"
-                    }
-                })
-
-        if coin in failed_electrums_wss:
-            x = list(failed_electrums_wss[coin].keys())
-            x.sort()
-            for i in x:
-                results[coin]["wss"].update({
-                    i: {
-                        "last_connection": get_last_connection(existing_report, coin, "wss", i),
-                        "result": failed_electrums_wss[coin][i]
-                    }
-                })
+        totals = {p: len(servers[p]) for p in servers}
+        working = {p: len([i for i in servers[p].values() if i["result"] == "Passed"]) for p in servers}
+        results.update({
+            coin: {
+                "electrums_total_all": sum(totals.values()),
+                "electrums_working_all": sum(working.values()),
+                "electrums_total_tcp": totals["tcp"],
+                "electrums_working_tcp": working["tcp"],
+                "electrums_total_ssl": totals["ssl"],
+                "electrums_working_ssl": working["ssl"],
+                "electrums_total_wss": totals["wss"],
+                "electrums_working_wss": working["wss"],
+                "tcp": servers["tcp"],
+                "ssl": servers["ssl"],
+                "wss": servers["wss"],
+                "electrums_hash": get_electrums_hash(electrum_dict.get(coin, []))
+            }
+        })
 
     with open(f"{script_path}/electrum_scan_report.json", "w+") as f:
         f.write(json.dumps(results, indent=4))
@@ -553,4 +694,10 @@ def get_electrums_report():
     # print(json.dumps(results, indent=4))
 
 if __name__ == '__main__':
-    get_electrums_report()
+    parser = argparse.ArgumentParser(description='Scans all electrums in the repo and updates electrum_scan_report.json')
+    parser.add_argument('--concurrency', type=int, default=SCAN_CONCURRENCY, help='Max number of servers probed at once')
+    parser.add_argument('--per-host', type=int, default=PER_HOST_CONCURRENCY, help='Max number of servers probed at once on the same hostname')
+    parser.add_argument('--incremental', action='store_true', help='Only probe failed, new or stale servers and merge them into the existing report')
+    parser.add_argument('--max-age', type=int, default=INCREMENTAL_MAX_AGE, help='Seconds after which a passed server is probed again in incremental mode')
+    args = parser.parse_args()
+    get_electrums_report(args.concurrency, args.incremental, args.max_age, args.per_host)
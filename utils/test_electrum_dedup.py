@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+import os
+import json
+import unittest
+import generate_app_configs as gac
+
+
+'''
+Regression tests for the electrum dedup in generate_app_configs.py
+(filter_duplicate_domains, electrum_keys and the SSL / TCP / WSS variants).
+
+    python3 -m unittest test_electrum_dedup     # or: pytest test_electrum_dedup.py
+'''
+
+script_path = os.path.abspath(os.path.dirname(__file__))
+repo_path = script_path.replace("/utils", "")
+
+
+def old_item_exists(i, electrums):
+    for e in electrums:
+        if "url" in e and "url" in i:
+            if i["url"] == e["url"]:
+                return True
+        if "ws_url" in e and "ws_url" in i:
+            if i["ws_url"] == e["ws_url"]:
+                return True
+    return False
+
+
+def old_filter_duplicate_domains(electrums):
+    domains = {}
+    for i in electrums:
+        domain = i["url"].split(":")[0]
+        if domain not in domains:
+            domains.update({domain: {i['protocol']: i['url']}})
+        else:
+            domains[domain].update({i['protocol']: i['url']})
+    for i in domains:
+        if "SSL" in domains[i] and "TCP" in domains[i]:
+            for e in electrums:
+                if e["url"].startswith(i) and e["protocol"] == "TCP":
+                    electrums.remove(e)
+    return electrums
+
+
+def old_tcp_electrums(coin_config, ssl_variant):
+    """The legacy desktop electrum list as built before the dedup was made linear."""
+    electrums = []
+    if ssl_variant is not None and len(ssl_variant["electrum"]) > 0:
+        electrums = list(ssl_variant["electrum"])
+    for i in coin_config["electrum"]:
+        if "gui_auth" in i:
+            if i["gui_auth"] == True:
+                continue
+        if old_item_exists(i, electrums) == False:
+            if "protocol" in i:
+                if i["protocol"] != "WSS":
+                    electrums.append(i)
+            else:
+                electrums.append(i)
+    return old_filter_duplicate_domains(electrums)
+
+
+def host(electrum):
+    return electrum["url"].split(":")[0]
+
+
+def electrum(url, protocol, **kwargs):
+    return {"url": url, "protocol": protocol, **kwargs}
+
+
+def load_repo_coin_config(coin):
+    """
+    The coin config "electrum" list for an electrums/ file, as parse_coins_repo
+    builds it when every server in the file passed the last scan.
+    """
+    with open(f"{repo_path}/electrums/{coin}", "r") as f:
+        electrums = json.load(f)
+    report = {"tcp": {}, "ssl": {}, "wss": {}}
+    passed = {"last_connection": int(gac.current_time), "result": "Passed"}
+    for i in electrums:
+        if "url" in i:
+            report[i.get("protocol", "TCP").lower()].update({i["url"]: passed})
+        if "ws_url" in i:
+            report["wss"].update({i["ws_url"]: passed})
+    return {"electrum": gac.get_valid_electrums(electrums, report)}
+
+
+class TestFilterDuplicateDomains(unittest.TestCase):
+    def test_keeps_every_entry_after_a_removal(self):
+        # The old filter removed while iterating, so TCP a:3 was skipped and kept.
+        electrums = [electrum("a:1", "SSL"), electrum("a:2", "TCP"), electrum("a:3", "TCP")]
+        self.assertEqual(gac.filter_duplicate_domains(electrums), [electrum("a:1", "SSL")])
+        self.assertEqual(old_filter_duplicate_domains(list(electrums)), [electrum("a:1", "SSL"), electrum("a:3", "TCP")])
+
+    def test_matches_hosts_exactly(self):
+        # The old filter matched by url prefix, so SSL on "a" dropped TCP on "ab".
+        electrums = [electrum("a:1", "SSL"), electrum("a:2", "TCP"), electrum("ab:2", "TCP")]
+        self.assertEqual(gac.filter_duplicate_domains(electrums), [electrum("a:1", "SSL"), electrum("ab:2", "TCP")])
+
+    def test_keeps_tcp_without_ssl_on_the_host(self):
+        electrums = [electrum("a:1", "SSL"), electrum("b:2", "TCP"), electrum("b:3", "TCP")]
+        self.assertEqual(gac.filter_duplicate_domains(electrums), electrums)
+
+    def test_does_not_modify_the_input(self):
+        electrums = [electrum("a:1", "SSL"), electrum("a:2", "TCP")]
+        gac.filter_duplicate_domains(electrums)
+        self.assertEqual(len(electrums), 2)
+
+
+class TestElectrumVariants(unittest.TestCase):
+    def test_url_already_taken_by_the_ssl_list(self):
+        coin_config = {"electrum": [
+            electrum("a:1", "SSL", contact=[{"email": "ssl"}]),
+            electrum("a:1", "TCP", contact=[{"email": "tcp"}]),
+            electrum("b:2", "TCP"),
+        ]}
+        ssl_variant = gac.get_ssl_variant(coin_config)
+        tcp_variant = gac.get_tcp_variant(coin_config, ssl_variant)
+        self.assertEqual(tcp_variant["electrum"], [coin_config["electrum"][0], electrum("b:2", "TCP")])
+
+    def test_wss_only_in_the_wss_variant(self):
+        coin_config = {"electrum": [
+            electrum("a:1", "SSL"),
+            electrum("a:2", "TCP"),
+            electrum("a:3", "WSS"),
+            electrum("b:3", "WSS"),
+        ]}
+        ssl_variant = gac.get_ssl_variant(coin_config)
+        tcp_variant = gac.get_tcp_variant(coin_config, ssl_variant)
+        wss_variant = gac.get_wss_variant(coin_config)
+        self.assertEqual(ssl_variant["electrum"], [electrum("a:1", "SSL")])
+        self.assertEqual(tcp_variant["electrum"], [electrum("a:1", "SSL")])
+        self.assertEqual(wss_variant["electrum"], [electrum("a:3", "WSS"), electrum("b:3", "WSS")])
+
+    def test_gui_auth_excluded_from_tcp_variant(self):
+        coin_config = {"electrum": [electrum("a:1", "TCP", gui_auth=True), electrum("b:2", "TCP")]}
+        tcp_variant = gac.get_tcp_variant(coin_config, gac.get_ssl_variant(coin_config))
+        self.assertEqual(tcp_variant["electrum"], [electrum("b:2", "TCP")])
+
+    def test_same_as_before_on_repo_electrums(self):
+        coins = sorted(
+            f for f in os.listdir(f"{repo_path}/electrums") if os.path.isfile(f"{repo_path}/electrums/{f}")
+        )
+        self.assertTrue(coins)
+        for coin in coins:
+            with self.subTest(coin=coin):
+                coin_config = load_repo_coin_config(coin)
+                if not coin_config["electrum"]:
+                    continue
+                ssl_variant = gac.get_ssl_variant(coin_config)
+                self.assertEqual(
+                    ssl_variant["electrum"],
+                    old_filter_duplicate_domains([i for i in coin_config["electrum"] if i.get("protocol") == "SSL"]),
+                )
+                # Besides the TCP servers on SSL hosts the old filter skipped (e.g. ZOMBIE), nothing changes.
+                old = old_tcp_electrums(coin_config, ssl_variant)
+                ssl_hosts = {host(i) for i in old if i["protocol"] == "SSL"}
+                self.assertEqual(
+                    gac.get_tcp_variant(coin_config, ssl_variant)["electrum"],
+                    [i for i in old if i["protocol"] != "TCP" or host(i) not in ssl_hosts],
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
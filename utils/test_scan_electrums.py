@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+import json
+import time
+import socket
+import asyncio
+import unittest
+import scan_electrums
+from logger import logger
+from mock_electrums import reply_to
+
+
+'''
+Tests for the per host limits of scan_electrums.run_scans, against electrum
+servers and blackholed ports on a loopback address (Linux routes all of
+127.0.0.0/8 to lo).
+
+    python3 -m unittest test_scan_electrums     # or: pytest test_scan_electrums.py
+'''
+
+HOST = "127.0.0.5"
+
+
+async def handle_electrum(reader, writer):
+    while line := await reader.readline():
+        writer.write(json.dumps(reply_to(json.loads(line), 1000)).encode() + b"\n")
+        await writer.drain()
+    writer.close()
+
+
+def blackholed_port(sockets):
+    """
+    Returns a port whose SYNs are dropped: it listens with a backlog of 0
+    and its accept queue is already taken by a connection nobody accepts.
+    """
+    listener = socket.socket()
+    listener.bind((HOST, 0))
+    listener.listen(0)
+    filler = socket.create_connection(listener.getsockname())
+    sockets.extend([listener, filler])
+    return listener.getsockname()[1]
+
+
+class TestHostLimits(unittest.TestCase):
+    def setUp(self):
+        self.timeouts = (scan_electrums.CONNECT_TIMEOUT, scan_electrums.PROBE_DEADLINE)
+        scan_electrums.CONNECT_TIMEOUT = 1
+        scan_electrums.PROBE_DEADLINE = 3
+        for passed, failed in scan_electrums.scan_results.values():
+            passed.clear()
+            failed.clear()
+        logger.disabled = True
+        self.sockets = []
+
+    def tearDown(self):
+        scan_electrums.CONNECT_TIMEOUT, scan_electrums.PROBE_DEADLINE = self.timeouts
+        logger.disabled = False
+        for i in self.sockets:
+            i.close()
+
+    def scan(self, live, dead, dead_first):
+        """Scans `live` electrums and `dead` blackholed ports on HOST. Returns (passed, failed, seconds)."""
+        async def run():
+            servers = [await asyncio.start_server(handle_electrum, HOST, 0) for _ in range(live)]
+            live_ports = [i.sockets[0].getsockname()[1] for i in servers]
+            dead_ports = [blackholed_port(self.sockets) for _ in range(dead)]
+            ports = dead_ports + live_ports if dead_first else live_ports + dead_ports
+            probes = [
+                (f"COIN{port}", HOST, str(port), "blockchain.headers.subscribe", [], "tcp") for port in ports
+            ]
+            start = time.perf_counter()
+            await scan_electrums.run_scans(probes, 200, 4)
+            elapsed = time.perf_counter() - start
+            for i in servers:
+                i.close()
+            return elapsed
+
+        elapsed = asyncio.run(run())
+        passed, failed = scan_electrums.scan_results["tcp"]
+        return len(passed), len(failed), elapsed
+
+    def test_live_ports_pass_after_blackholed_ones(self):
+        passed, failed, elapsed = self.scan(20, 4, dead_first=True)
+        self.assertEqual((passed, failed), (20, 4))
+
+    def test_live_ports_pass_before_blackholed_ones(self):
+        passed, failed, elapsed = self.scan(20, 4, dead_first=False)
+        self.assertEqual((passed, failed), (20, 4))
+
+    def test_blackholed_host_is_not_scanned_in_waves(self):
+        # 20 ports 4 at a time would take 5 connect timeouts, the limit is lifted after the first wave.
+        passed, failed, elapsed = self.scan(0, 20, dead_first=True)
+        self.assertEqual((passed, failed), (0, 20))
+        self.assertLess(elapsed, 4 * scan_electrums.CONNECT_TIMEOUT)
+
+
+if __name__ == "__main__":
+    unittest.main()